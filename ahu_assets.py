@@ -0,0 +1,268 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from PIL import Image
+
+# --- Thumbnail Configuration ---
+IMAGE_DIR = "images"
+# Rendered thumbnails, content-addressed by source hash, width and format
+THUMBNAIL_DIR = ".thumbnails"
+# Static serving mode: thumbnails are written next to the app in static/ and fetched by the browser by URL
+STATIC_THUMBNAIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "thumbnails")
+STATIC_BASE_URL = "app/static/thumbnails"
+
+# Display widths used by the app (CSS px); every image is rendered at 1x and 2x of these
+LOGO_OVERVIEW_WIDTH = 60
+LOGO_WIDTH = 150
+PHOTO_WIDTH = 400
+
+THUMBNAIL_FORMATS = {"webp": ("WEBP", {"quality": 85, "method": 6}), "png": ("PNG", {"optimize": True})}
+# Thumbnail file names carry the source content hash, e.g. "Swegon.3f1c0a9d2b7e4c61-150w.webp"
+THUMBNAIL_NAME_PATTERN = re.compile(r"\.([0-9a-f]{16})-\d+w\.\w+$")
+
+
+# --- Image Manifest ---
+ImageInfo = namedtuple("ImageInfo", ["path", "width", "height", "content_hash", "columns"])
+
+
+def content_hash(path):
+    """Short content hash used in thumbnail names."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+class ImageManifest:
+    """Every image name referenced by the workbooks, resolved once against IMAGE_DIR.
+
+    references maps a column label (e.g. "Market: Country Flag") to the names found in that column.
+    Renderers look names up here instead of probing the disk: get() returns an ImageInfo, or None for a
+    missing or unreadable image. missing and unreferenced list the gaps in both directions.
+    """
+
+    def __init__(self, references, image_dir=IMAGE_DIR):
+        self.image_dir = image_dir
+        columns_by_name = {}
+        for column, names in references.items():
+            for name in names:
+                columns_by_name.setdefault(str(name), []).append(column)
+
+        self.images = {}
+        self.missing = {}
+        for name, columns in sorted(columns_by_name.items()):
+            path = os.path.join(image_dir, name)
+            try:
+                with Image.open(path) as im:
+                    width, height = im.size
+                self.images[name] = ImageInfo(path, width, height, content_hash(path), tuple(columns))
+            except OSError:
+                self.missing[name] = tuple(columns)
+
+        try:
+            files = {entry.name for entry in os.scandir(image_dir) if entry.is_file()}
+        except OSError:
+            files = set()
+        self.unreferenced = sorted(files - set(columns_by_name))
+
+    def get(self, name):
+        return self.images.get(str(name))
+
+    def __contains__(self, name):
+        return str(name) in self.images
+
+    def __len__(self):
+        return len(self.images)
+
+
+# --- In-Memory LRU ---
+class ByteLRU:
+    """Thread-safe LRU of bytes values bounded by their total size, with hit/miss counters."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self.size -= len(self._items.pop(key))
+            if len(value) > self.max_bytes:
+                return
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# --- Thumbnail Pipeline ---
+class ThumbnailStore:
+    """Renders images from IMAGE_DIR at display sizes and serves them from memory, then disk.
+
+    Each (source content, width, format) is rendered once and written to THUMBNAIL_DIR under a
+    content-addressed name, so edited images get new thumbnails and unchanged ones are never re-rendered.
+    """
+
+    def __init__(self, image_dir=IMAGE_DIR, thumbnail_dir=THUMBNAIL_DIR, max_bytes=32 * 1024 * 1024):
+        self.image_dir = image_dir
+        self.thumbnail_dir = thumbnail_dir
+        self.cache = ByteLRU(max_bytes)
+        self._source_hashes = {}
+        self._manifest_hashes = {}
+        self._on_disk = set()
+
+    def register(self, manifest):
+        """Takes source hashes from an ImageManifest, so thumbnail lookups need no stat or read of the source.
+
+        The manifest must be rebuilt when a source changes (the app keys it on every file's size and mtime).
+        """
+        self._manifest_hashes.update((name, info.content_hash) for name, info in manifest.images.items())
+
+    def source_path(self, name):
+        return os.path.join(self.image_dir, str(name))
+
+    def source_hash(self, name):
+        """Content hash of a source image (re-read only when its size or mtime change); None if missing."""
+        if str(name) in self._manifest_hashes:
+            return self._manifest_hashes[str(name)]
+        path = self.source_path(name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._source_hashes:
+            self._source_hashes[memo_key] = content_hash(path)
+        return self._source_hashes[memo_key]
+
+    def thumbnail_name(self, name, width, fmt):
+        """Content-addressed file name of a thumbnail, e.g. 'Swegon.3f1c...-150w.webp'."""
+        content_hash = self.source_hash(name)
+        if content_hash is None:
+            return None
+        stem = os.path.splitext(os.path.basename(str(name)))[0].replace(" ", "_")
+        return f"{stem}.{content_hash}-{width}w.{fmt}"
+
+    def _render(self, name, width, fmt):
+        pil_format, options = THUMBNAIL_FORMATS[fmt]
+        with Image.open(self.source_path(name)) as im:
+            im = im.convert("RGBA")
+            if im.width > width:
+                im = im.resize((width, max(1, round(im.height * width / im.width))), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            im.save(out, pil_format, **options)
+        return out.getvalue()
+
+    def get(self, name, width, fmt="webp"):
+        """Thumbnail bytes of images/<name> at the given pixel width, or None if the source is missing."""
+        thumb_name = self.thumbnail_name(name, width, fmt)
+        if thumb_name is None:
+            return None
+        data = self.cache.get(thumb_name)
+        if data is not None:
+            return data
+
+        thumb_path = os.path.join(self.thumbnail_dir, thumb_name)
+        try:
+            with open(thumb_path, "rb") as f:
+                data = f.read()
+            self._on_disk.add(thumb_name)
+        except OSError:
+            try:
+                data = self._render(name, width, fmt)
+            except OSError:
+                return None  # Unreadable or not an image
+            # Per-writer temp name: sessions rendering the same thumbnail never write into one file
+            tmp_path = f"{thumb_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(self.thumbnail_dir, exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, thumb_path)
+                self._on_disk.add(thumb_name)
+            except OSError:
+                # Read-only deployment: serve from memory only
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self.cache.put(thumb_name, data)
+        return data
+
+    def url(self, name, width, fmt, base_url=STATIC_BASE_URL):
+        """URL of a thumbnail file under base_url, rendering it to disk first; None if it cannot be served."""
+        thumb_name = self.thumbnail_name(name, width, fmt)
+        if thumb_name is None:
+            return None
+        if thumb_name not in self._on_disk:
+            self.get(name, width, fmt)
+            if thumb_name not in self._on_disk:
+                return None
+        return f"{base_url}/{thumb_name}"
+
+    def srcset(self, name, display_width, fmt, base_url=STATIC_BASE_URL):
+        """'<1x url> 1x, <2x url> 2x' for a <picture> source, or None if the image cannot be served."""
+        urls = [self.url(name, display_width * scale, fmt, base_url) for scale in (1, 2)]
+        if None in urls:
+            return None
+        return f"{urls[0]} 1x, {urls[1]} 2x"
+
+    def variants(self, name, display_width):
+        """All renditions of one displayed image: {(scale, fmt): bytes} for 1x/2x in WebP and PNG."""
+        return {
+            (scale, fmt): self.get(name, display_width * scale, fmt)
+            for scale in (1, 2)
+            for fmt in THUMBNAIL_FORMATS
+        }
+
+    def prune(self):
+        """Deletes thumbnails whose source content is no longer in image_dir; returns how many were removed.
+
+        Thumbnails of edited or removed images can never be requested again, so without this the folder
+        only grows (and Streamlit stops serving static/ once it passes 1 GB).
+        """
+        try:
+            with os.scandir(self.image_dir) as entries:
+                sources = [entry.name for entry in entries if entry.is_file()]
+            with os.scandir(self.thumbnail_dir) as entries:
+                thumb_names = [entry.name for entry in entries if entry.is_file()]
+        except OSError:
+            return 0
+        current = {self.source_hash(name) for name in sources}
+        removed = 0
+        for thumb_name in thumb_names:
+            match = THUMBNAIL_NAME_PATTERN.search(thumb_name)
+            if match is None or match.group(1) in current:
+                continue
+            try:
+                os.remove(os.path.join(self.thumbnail_dir, thumb_name))
+                removed += 1
+            except OSError:
+                pass  # Read-only deployment, or another process removed it first
+            self._on_disk.discard(thumb_name)
+        return removed
+
+    def prerender(self, names, display_widths):
+        """Renders every variant of the given images ahead of the first request."""
+        for name in names:
+            for width in display_widths:
+                self.variants(name, width)
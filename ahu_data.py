@@ -0,0 +1,1332 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+try:
+    import duckdb
+except ImportError:  # Optional: only needed for the "duckdb" query backend
+    duckdb = None
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows locks the snapshot catalog with msvcrt instead
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+from ahu_schema import ColumnResolver, CompiledSchema
+
+# --- Snapshot Configuration ---
+# Converted workbooks are kept next to the app, one Arrow file per (workbook, sheet, content hash)
+SNAPSHOT_DIR = ".snapshots"
+
+_hash_memo = {}
+
+
+# --- Content Hashing ---
+def file_content_hash(path):
+    """Returns the SHA-256 of the file contents, re-hashing only when size or mtime change."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _hash_memo:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+# --- Streaming Excel Ingest ---
+# Cell texts pandas.read_excel treats as missing by default (e.g. the 'N/A' entries in the competitor sheet)
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+
+def _dedupe_headers(headers):
+    # Same convention as pandas.read_excel: repeated names get ".1", ".2", ... suffixes
+    seen = {}
+    result = []
+    for name in headers:
+        if name in seen:
+            seen[name] += 1
+            result.append(f"{name}.{seen[name]}")
+        else:
+            seen[name] = 0
+            result.append(name)
+    return result
+
+
+def read_excel_streaming(path, sheet_name=0):
+    """Reads a sheet row by row with openpyxl in read-only mode.
+
+    The header row is read first and only cells under a non-empty header are kept, so the
+    hundreds of formatted-but-empty columns in the declared sheet dimension never become
+    'Unnamed: N' columns. Fully blank rows are skipped, like pandas.read_excel does.
+    """
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if isinstance(sheet_name, str) else wb.worksheets[sheet_name]
+        rows = ws.iter_rows(values_only=True)
+        header_row = next(rows, ())
+        positions = [i for i, h in enumerate(header_row) if h is not None and str(h).strip() != ""]
+        if not positions:
+            return pd.DataFrame()
+        headers = _dedupe_headers([header_row[i] for i in positions])
+        last = positions[-1] + 1
+
+        columns = [[] for _ in positions]
+        for row in ws.iter_rows(min_row=2, max_col=last, values_only=True):
+            values = [row[i] if i < len(row) else None for i in positions]
+            values = [None if isinstance(v, str) and v in NA_STRINGS else v for v in values]
+            if all(v is None for v in values):
+                continue
+            values = [float("nan") if v is None else v for v in values]
+            for column, value in zip(columns, values):
+                column.append(value)
+    finally:
+        wb.close()
+
+    # pd.Series does the same per-column inference as read_excel (int64, float64 with NaN, str, object)
+    return pd.DataFrame({h: pd.Series(col) for h, col in zip(headers, columns)})
+
+
+def compare_ingest(path, sheet_name=0):
+    """Times both loaders on the same sheet and reports their shape and deep memory footprint."""
+    report = {}
+    loaders = {
+        "read_excel": lambda: pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl"),
+        "streaming": lambda: read_excel_streaming(path, sheet_name),
+    }
+    for name, loader in loaders.items():
+        start = time.perf_counter()
+        df = loader()
+        elapsed = time.perf_counter() - start
+        report[name] = {
+            "seconds": elapsed,
+            "rows": df.shape[0],
+            "columns": df.shape[1],
+            "memory_bytes": int(df.memory_usage(deep=True).sum()),
+        }
+    report["seconds_saved"] = report["read_excel"]["seconds"] - report["streaming"]["seconds"]
+    report["memory_saved_bytes"] = report["read_excel"]["memory_bytes"] - report["streaming"]["memory_bytes"]
+    return report
+
+
+# --- Arrow Snapshots ---
+def _snapshot_stem(path, sheet_name):
+    base = os.path.splitext(os.path.basename(path))[0].replace(" ", "_")
+    return f"{base}__{sheet_name}"
+
+
+def snapshot_path(path, sheet_name, content_hash, snapshot_dir=SNAPSHOT_DIR):
+    """Location of the Arrow snapshot for one sheet of one workbook version."""
+    return os.path.join(snapshot_dir, f"{_snapshot_stem(path, sheet_name)}__{content_hash[:16]}.arrow")
+
+
+def to_arrow_compatible(df):
+    """Gives every object column a single Arrow type.
+
+    Columns mixing numbers and text (e.g. 'Type' holds both 0 and 'NH.RRG') become strings,
+    object columns that are purely numeric become numbers. Missing values stay missing.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        numeric = pd.to_numeric(df[col], errors="coerce")
+        if numeric.notna().sum() == df[col].notna().sum():
+            df[col] = numeric
+        else:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v)).astype("string")
+    return df
+
+
+def write_snapshot(df, path):
+    """Writes an uncompressed Arrow IPC file so it can be memory-mapped on load."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Per-writer temp name: concurrent conversions of the same workbook never write into one file
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_snapshot(path):
+    """Memory-maps an Arrow snapshot; numeric columns are handed to pandas without copying."""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def _remove_stale_snapshots(path, sheet_name, keep, snapshot_dir=SNAPSHOT_DIR):
+    prefix = _snapshot_stem(path, sheet_name) + "__"
+    if not os.path.isdir(snapshot_dir):
+        return
+    for name in os.listdir(snapshot_dir):
+        full = os.path.join(snapshot_dir, name)
+        if name.startswith(prefix) and name.endswith(".arrow") and full != keep:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+
+
+def load_workbook_snapshot(path, sheet_name=0, snapshot_dir=SNAPSHOT_DIR):
+    """Loads one sheet, converting the xlsx only when no snapshot exists for its content hash.
+
+    Returns (DataFrame, content_hash). Raises FileNotFoundError if the workbook is missing.
+    """
+    content_hash = file_content_hash(path)
+    sheet_key = sheet_name if isinstance(sheet_name, str) else f"sheet{sheet_name}"
+    snap = snapshot_path(path, sheet_key, content_hash, snapshot_dir)
+    if os.path.exists(snap):
+        try:
+            return read_snapshot(snap), content_hash
+        except (OSError, pa.ArrowInvalid):
+            pass  # Corrupt or truncated snapshot, rebuild it from the workbook below
+
+    df = to_arrow_compatible(read_excel_streaming(path, sheet_name))
+    try:
+        write_snapshot(df, snap)
+        _remove_stale_snapshots(path, sheet_key, snap, snapshot_dir)
+        df = read_snapshot(snap)
+    except OSError:
+        pass  # Read-only deployment: keep serving the freshly parsed frame
+    return df, content_hash
+
+
+# --- Partitioned Storage ---
+# Every session looks at one Year/Quarter/Region at a time, so each sheet is also stored split by them:
+# one Parquet file per partition in hive-style directories (Year=2025/Quarter=Q3/Region=.../part-0.parquet)
+PARTITION_COLUMNS = ["Year", "Quarter", "Region"]
+PARTITION_CATALOG = "_catalog.json"
+
+
+def partition_root(path, sheet_name, content_hash, snapshot_dir=SNAPSHOT_DIR):
+    """Directory holding the partitions of one sheet of one workbook version."""
+    return os.path.join(snapshot_dir, "partitions", f"{_snapshot_stem(path, sheet_name)}__{content_hash[:16]}")
+
+
+def partition_key(values):
+    """Normalised partition key: Python scalars, with integral floats as ints.
+
+    A blank Year cell turns the whole column into floats, so 2025.0 and 2025 must name the same partition.
+    """
+    key = []
+    for value in values:
+        value = _python_value(value)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        key.append(value)
+    return tuple(key)
+
+
+def _partition_groups(df):
+    """{partition key: row positions} in key order. Rows missing a key value belong to no partition."""
+    resolver = ColumnResolver(df.columns)
+    columns = [resolver.resolve(name) for name in PARTITION_COLUMNS]
+    if df.empty or None in columns:
+        return {}
+    groups = df.groupby(columns, sort=True, dropna=True).indices
+    return {partition_key(key): positions for key, positions in groups.items()}
+
+
+def _partition_file(root, key):
+    parts = [f"{col}={quote(str(value), safe='')}" for col, value in zip(PARTITION_COLUMNS, key)]
+    return os.path.join(root, *parts, "part-0.parquet")
+
+
+def write_partitions(df, root):
+    """Writes the partitions of a sheet and their catalog (columns, keys, row counts) under root.
+
+    Each builder writes to its own temp directory and moves it into place whole, so concurrent
+    ingests of the same version never see or remove each other's half-written files.
+    """
+    tmp_root = f"{root}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        groups = _partition_groups(df)
+        for key, positions in groups.items():
+            path = _partition_file(tmp_root, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(df.iloc[positions], preserve_index=False), path)
+        os.makedirs(tmp_root, exist_ok=True)
+        with open(os.path.join(tmp_root, PARTITION_CATALOG), "w") as f:
+            json.dump({
+                "columns": list(df.columns),
+                "partitions": [{"key": list(key), "rows": len(positions)} for key, positions in groups.items()],
+            }, f)
+        if not os.path.isdir(root):
+            try:
+                os.replace(tmp_root, root)
+            except OSError:
+                if not os.path.isdir(root):
+                    raise
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)  # Leftover when another process finished first
+
+
+class PartitionedTable:
+    """One sheet split by Year/Quarter/Region; read(key) loads a single partition.
+
+    The catalog (columns and row count per key) is all that is held until a partition is read.
+    Without a writable snapshot directory the partitions are sliced from a frame kept in memory.
+    """
+
+    def __init__(self, root=None, frame=None):
+        self.root = root
+        self._frame = frame
+        if frame is not None:
+            self._groups = _partition_groups(frame)
+            self.columns = list(frame.columns)
+            self.partitions = {key: len(positions) for key, positions in self._groups.items()}
+        elif root is not None:
+            with open(os.path.join(root, PARTITION_CATALOG)) as f:
+                catalog = json.load(f)
+            self.columns = catalog["columns"]
+            self.partitions = {partition_key(p["key"]): p["rows"] for p in catalog["partitions"]}
+            # Files are named after the key as written, which older catalogs may hold as floats
+            self._stored_keys = {partition_key(p["key"]): tuple(p["key"]) for p in catalog["partitions"]}
+        else:
+            self.columns = []
+            self.partitions = {}
+
+    def keys(self):
+        return list(self.partitions)
+
+    def read(self, key):
+        """Rows of one partition, in workbook order; an empty frame for keys with no rows."""
+        key = partition_key(key)
+        if key not in self.partitions:
+            return pd.DataFrame(columns=self.columns)
+        if self._frame is not None:
+            return self._frame.iloc[self._groups[key]].reset_index(drop=True)
+        path = _partition_file(self.root, self._stored_keys[key])
+        return pq.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+    def read_columns(self, columns):
+        """Some columns of every partition, concatenated; only those columns are read from disk."""
+        columns = [col for col in columns if col in self.columns]
+        if not self.partitions:
+            return pd.DataFrame(columns=columns)
+        if self._frame is not None:
+            positions = np.sort(np.concatenate(list(self._groups.values())))
+            return self._frame[columns].iloc[positions].reset_index(drop=True)
+        frames = [
+            pq.read_table(_partition_file(self.root, self._stored_keys[key]), columns=columns, memory_map=True).to_pandas()
+            for key in self.partitions
+        ]
+        return pd.concat(frames, ignore_index=True)
+
+
+def load_partitioned_table(path, sheet_name=0, snapshot_dir=SNAPSHOT_DIR):
+    """Catalog of one sheet's partitions, writing them from its snapshot only for a new content hash.
+
+    Returns (PartitionedTable, content_hash). Raises FileNotFoundError if the workbook is missing.
+    """
+    content_hash = file_content_hash(path)
+    sheet_key = sheet_name if isinstance(sheet_name, str) else f"sheet{sheet_name}"
+    root = partition_root(path, sheet_key, content_hash, snapshot_dir)
+    if os.path.exists(os.path.join(root, PARTITION_CATALOG)):
+        try:
+            return PartitionedTable(root), content_hash
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(root, ignore_errors=True)  # Damaged catalog, rebuild it below
+
+    df, _ = load_workbook_snapshot(path, sheet_name, snapshot_dir)
+    try:
+        write_partitions(df, root)
+        return PartitionedTable(root), content_hash
+    except OSError:
+        return PartitionedTable(frame=df), content_hash  # Read-only deployment
+
+
+# --- Bitmap Filter Index ---
+# Columns of the sidebar cascade; every selection in the app is an intersection of their values
+MARKET_CASCADE_COLUMNS = ["Year", "Quarter", "Region", "Country", "Brand name"]
+COMPETITOR_CASCADE_COLUMNS = [
+    "Year", "Quarter", "Region", "Brand name", "Unit name", "Recovery type", "Unit size", "Type", "Material",
+]
+
+
+class BitmapIndex:
+    """Packed per-value row bitmaps for the cascade columns of one table.
+
+    Filters are resolved by AND-ing bitmaps and come back as row positions, so callers
+    never build intermediate boolean masks or sub-frames. Missing values are not indexed.
+    """
+
+    def __init__(self, df, columns):
+        self.num_rows = len(df)
+        self.codes = {}
+        self.uniques = {}
+        self.bitmaps = {}
+        self.all_rows = np.packbits(np.ones(self.num_rows, dtype=bool))
+        self.no_rows = np.zeros_like(self.all_rows)
+        self._facet_memo = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col])
+            uniques = np.asarray(uniques, dtype=object)
+            self.codes[col] = codes
+            self.uniques[col] = uniques
+            self.bitmaps[col] = {value: np.packbits(codes == k) for k, value in enumerate(uniques)}
+
+    def __contains__(self, col):
+        return col in self.bitmaps
+
+    def bitmap(self, col, value):
+        """Rows where col == value (an empty bitmap for unknown values)."""
+        return self.bitmaps[col].get(value, self.no_rows)
+
+    def intersect(self, filters, within=None):
+        """ANDs the bitmaps of {column: value}; None columns or values mean 'no constraint'."""
+        bits = self.all_rows if within is None else within
+        for col, value in filters.items():
+            if col is None or value is None:
+                continue
+            bits = np.bitwise_and(bits, self.bitmap(col, value))
+        return bits
+
+    def positions(self, bits):
+        """Row positions (ascending) set in a bitmap."""
+        return np.flatnonzero(np.unpackbits(bits, count=self.num_rows))
+
+    def select(self, filters, within=None):
+        return self.positions(self.intersect(filters, within))
+
+    def facet_counts(self, col, bits, distinct_col=None):
+        """{value: (rows, distinct distinct_col values)} for every value of col among the rows of a bitmap.
+
+        Counting is a bincount over the factorized codes, so it stays O(rows) however many values
+        the column has. Results are memoised per (column, bitmap), bounded to the last 1024 queries.
+        """
+        key = (col, distinct_col, bits.tobytes())
+        # Shared by all sessions: another thread may clear the memo between a membership test and the read
+        counts = self._facet_memo.get(key)
+        if counts is not None:
+            return counts
+
+        positions = self.positions(bits)
+        codes = self.codes[col][positions]
+        present = codes >= 0
+        num_values = len(self.uniques[col])
+        rows = np.bincount(codes[present], minlength=num_values)
+        distinct = np.zeros(num_values, dtype=np.int64)
+        if distinct_col is not None and distinct_col in self.codes:
+            other = self.codes[distinct_col][positions]
+            both = present & (other >= 0)
+            num_other = len(self.uniques[distinct_col])
+            pairs = np.unique(codes[both].astype(np.int64) * num_other + other[both])
+            distinct = np.bincount(pairs // num_other, minlength=num_values)
+
+        counts = {self.uniques[col][k]: (int(rows[k]), int(distinct[k])) for k in np.flatnonzero(rows)}
+        if len(self._facet_memo) >= 1024:
+            self._facet_memo.clear()
+        self._facet_memo[key] = counts
+        return counts
+
+    def value_at(self, col, position):
+        """Value of col at one row position (None if missing)."""
+        code = self.codes[col][position]
+        return self.uniques[col][code] if code >= 0 else None
+
+
+# --- DuckDB Query Backend ---
+# Backend names accepted by Dataset; "bitmap" keeps every filter in memory, "duckdb" runs them as SQL
+QUERY_BACKENDS = ("bitmap", "duckdb")
+
+
+def duckdb_path(version, snapshot_dir=SNAPSHOT_DIR):
+    """Location of the DuckDB file holding the cascade tables of one dataset version.
+
+    Named after the two workbook hashes, followed by the partition key (see PartitionedDataset).
+    """
+    name = "cascade__" + "_".join(str(h)[:16] for h in version[:2])
+    if len(version) > 2:
+        name += "__" + quote("_".join(str(v) for v in version[2:]), safe="")
+    return os.path.join(snapshot_dir, name + ".duckdb")
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _python_value(value):
+    # SQL parameters and JSON catalogs take Python scalars; numpy scalars from pandas are unwrapped
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class DuckDBStore:
+    """Embedded DuckDB database with the cascade columns of the market and competitor tables.
+
+    Each table keeps the typed cascade columns plus _row, the row position in the shared frame,
+    and is stored sorted on the cascade columns so filters on leading keys read few row groups.
+    The file is built once per dataset version; later processes open it read-only. Every thread
+    queries through its own cursor.
+    """
+
+    def __init__(self, tables, version, snapshot_dir=SNAPSHOT_DIR):
+        if duckdb is None:
+            raise ImportError("The duckdb query backend needs the 'duckdb' package")
+        self.path = duckdb_path(version, snapshot_dir)
+        self._local = threading.local()
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(snapshot_dir, exist_ok=True)
+                # Unique per builder and cleared first, so an interrupted build never leaves a half-made table behind
+                tmp_path = f"{self.path}.{os.getpid()}-{threading.get_ident()}.tmp"
+                self._remove_files(tmp_path)
+                try:
+                    self._build(duckdb.connect(tmp_path), tables)
+                    os.replace(tmp_path, self.path)
+                finally:
+                    self._remove_files(tmp_path)
+            self._con = duckdb.connect(self.path, read_only=True)
+        except (OSError, duckdb.Error):
+            self.path = None  # Read-only deployment or unreadable file: keep the tables in memory
+            self._con = duckdb.connect()
+            self._build(self._con, tables, close=False)
+
+    @staticmethod
+    def _remove_files(path):
+        for leftover in (path, path + ".wal"):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _build(con, tables, close=True):
+        for table, (df, columns) in tables.items():
+            columns = [col for col in columns if col in df.columns]
+            frame = pa.Table.from_pandas(
+                df[columns].assign(_row=np.arange(len(df), dtype=np.int64)), preserve_index=False
+            )
+            con.register("frame", frame)
+            order = ", ".join([_quote(col) for col in columns] + ["_row"])
+            con.execute(f"CREATE TABLE {_quote(table)} AS SELECT * FROM frame ORDER BY {order}")
+            con.execute(f"CREATE INDEX {_quote(table + '_row')} ON {_quote(table)} (_row)")
+            con.unregister("frame")
+        if close:
+            con.close()
+
+    def query(self, sql, params=()):
+        """Runs a parameterised statement on this thread's cursor and returns an Arrow table."""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self._con.cursor()
+        return cursor.execute(sql, [_python_value(p) for p in params]).fetch_arrow_table()
+
+
+class DuckDBIndex:
+    """BitmapIndex interface answered by SQL against one DuckDBStore table.
+
+    The "bitmaps" passed between calls are predicates: frozensets of (column, value) pairs that
+    are AND-ed in the WHERE clause. Statement texts depend only on which columns are filtered,
+    so each shape is composed once and reused with new parameters.
+    """
+
+    all_rows = frozenset()
+
+    def __init__(self, store, table, df, columns):
+        self.store = store
+        self.table = _quote(table)
+        self.num_rows = len(df)
+        self.columns = [col for col in columns if col in df.columns]
+        self._statements = {}
+        self._facet_memo = {}
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    def bitmap(self, col, value):
+        if col not in self.columns:
+            raise KeyError(col)
+        return frozenset([(col, value)])
+
+    def intersect(self, filters, within=None):
+        bits = self.all_rows if within is None else within
+        pairs = [(col, value) for col, value in filters.items() if col is not None and value is not None]
+        for col, _ in pairs:
+            if col not in self.columns:
+                raise KeyError(col)
+        return bits | frozenset(pairs)
+
+    def _where(self, bits):
+        pairs = sorted(bits, key=lambda pair: (pair[0], repr(pair[1])))
+        return tuple(col for col, _ in pairs), [value for _, value in pairs]
+
+    def _statement(self, kind, filter_cols, *cols):
+        key = (kind, filter_cols) + cols
+        if key not in self._statements:
+            where = " AND ".join([f"{_quote(col)} = ?" for col in filter_cols] or ["TRUE"])
+            if kind == "positions":
+                sql = f"SELECT _row FROM {self.table} WHERE {where} ORDER BY _row"
+            elif kind == "facets":
+                col = _quote(cols[0])
+                distinct = f"count(DISTINCT {_quote(cols[1])})" if cols[1] is not None else "0"
+                sql = (
+                    f"SELECT {col}, count(*), {distinct} FROM {self.table} WHERE {where} AND {col} IS NOT NULL "
+                    f"GROUP BY {col} ORDER BY min(_row)"
+                )
+            else:
+                sql = f"SELECT {_quote(cols[0])} FROM {self.table} WHERE _row = ?"
+            self._statements[key] = sql
+        return self._statements[key]
+
+    def positions(self, bits):
+        filter_cols, params = self._where(bits)
+        result = self.store.query(self._statement("positions", filter_cols), params)
+        return result.column(0).to_numpy().astype(np.int64, copy=False)
+
+    def select(self, filters, within=None):
+        return self.positions(self.intersect(filters, within))
+
+    def facet_counts(self, col, bits, distinct_col=None):
+        """{value: (rows, distinct distinct_col values)} from one GROUP BY, memoised like BitmapIndex."""
+        if distinct_col not in self.columns:
+            distinct_col = None
+        key = (col, distinct_col, bits)
+        counts = self._facet_memo.get(key)  # One read: another session may clear the memo concurrently
+        if counts is not None:
+            return counts
+        filter_cols, params = self._where(bits)
+        values, rows, distinct = self.store.query(
+            self._statement("facets", filter_cols, col, distinct_col), params
+        ).to_pydict().values()
+        counts = {value: (int(n), int(d)) for value, n, d in zip(values, rows, distinct)}
+        if len(self._facet_memo) >= 1024:
+            self._facet_memo.clear()
+        self._facet_memo[key] = counts
+        return counts
+
+    def value_at(self, col, position):
+        values = self.store.query(self._statement("value", (), col), [int(position)]).column(0).to_pylist()
+        return values[0] if values else None
+
+
+# --- Cascade Option Tree ---
+class OptionTree:
+    """Presorted dropdown options for a fixed chain of columns, built once per dataset version.
+
+    options(path) returns the sorted distinct values of level len(path) among rows matching the
+    given prefix of values, e.g. options((2025, "Q3")) lists the regions of 2025/Q3. Each call is a
+    single dict lookup. leaf_columns (e.g. Type/Material) are listed under complete paths.
+    """
+
+    def __init__(self, df, levels, leaf_columns=()):
+        self.levels = []
+        for col in levels:
+            if col not in df.columns:
+                break
+            self.levels.append(col)
+        self._options = {}
+        self._leaf_options = {}
+
+        for depth in range(len(self.levels)):
+            cols = self.levels[:depth + 1]
+            for row in df[cols].dropna().drop_duplicates().itertuples(index=False, name=None):
+                self._options.setdefault(row[:-1], []).append(row[-1])
+
+        for leaf in leaf_columns:
+            if leaf not in df.columns or not self.levels:
+                continue
+            cols = self.levels + [leaf]
+            for row in df[cols].dropna().drop_duplicates().itertuples(index=False, name=None):
+                self._leaf_options.setdefault((row[:-1], leaf), []).append(row[-1])
+
+        for table in (self._options, self._leaf_options):
+            for key in table:
+                table[key] = sorted(table[key])
+
+    def options(self, path=()):
+        return self._options.get(tuple(path), [])
+
+    def leaf_options(self, path, leaf):
+        return self._leaf_options.get((tuple(path), leaf), [])
+
+
+# --- Numeric Columns ---
+# Headers ending in a unit like "Unit cross section area (Supply Filter) [m2]" hold measurements
+UNIT_SUFFIX_PATTERN = re.compile(r"\[\s*(mm|m2|kW|%|CMH|m/s|kg)\s*\]\s*$")
+
+
+class NumericColumns:
+    """Float arrays of every unit-suffixed column, converted once per dataset.
+
+    values[col] is a float64 array aligned with the table rows (NaN where the cell is empty or not a
+    number) and valid[col] the matching mask. unparsed counts the non-empty cells that did not convert,
+    e.g. "1.15 (0.8)" in Motor rated power [kW].
+    """
+
+    def __init__(self, df):
+        self.columns = [col for col in df.columns if UNIT_SUFFIX_PATTERN.search(str(col))]
+        self.values = {}
+        self.valid = {}
+        self.unparsed = {}
+        for col in self.columns:
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            values.flags.writeable = False
+            self.values[col] = values
+            self.valid[col] = ~np.isnan(values)
+            self.valid[col].flags.writeable = False
+            unparsed = int((df[col].notna().to_numpy() & np.isnan(values)).sum())
+            if unparsed:
+                self.unparsed[col] = unparsed
+
+    def __contains__(self, col):
+        return col in self.values
+
+    def value(self, col, position):
+        """Float value of one cell, NaN if the column is unknown or the cell not numeric."""
+        if col not in self.values or position is None:
+            return np.nan
+        return float(self.values[col][position])
+
+
+# --- Outline Geometry ---
+# Three outlines of up to five (x, y) points each: supply filter x1..x5, supply fan x6..x10, duct x11..x15
+OUTLINE_NAMES = ["Supply Filter", "Supply Fan", "Duct"]
+OUTLINE_POINTS = 5
+# Reported cross section areas the filter and fan outlines are checked against, and the allowed relative gap
+OUTLINE_AREA_COLUMNS = {
+    0: "Unit cross section area (Supply Filter) [m2]",
+    1: "Unit cross section area (Supply Fan) [m2]",
+}
+AREA_TOLERANCE = 0.02
+
+
+class OutlineGeometry:
+    """The x1..x15 / y1..y15 outline columns packed into one float array.
+
+    points has shape (rows, 3 outlines, 5 points, 2) with each outline's valid points (both x and y
+    present and numeric) compacted to the front in column order and NaN after them; counts has shape
+    (rows, 3) and holds the number of valid points.
+
+    Derived per row and outline, all in one vectorised pass: areas (shoelace, m², NaN below 3 points),
+    bbox (min x, min y, max x, max y in mm). coordinate_columns maps x1..y15 to the workbook headers.
+    """
+
+    def __init__(self, df, coordinate_columns=None):
+        num_rows = len(df)
+        coordinate_columns = coordinate_columns or {}
+        raw = np.full((num_rows, len(OUTLINE_NAMES), OUTLINE_POINTS, 2), np.nan)
+        for k in range(len(OUTLINE_NAMES)):
+            for j in range(OUTLINE_POINTS):
+                for axis, prefix in enumerate("xy"):
+                    name = f"{prefix}{k * OUTLINE_POINTS + j + 1}"
+                    col = coordinate_columns.get(name, name)
+                    if col in df.columns:
+                        raw[:, k, j, axis] = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+        valid = ~np.isnan(raw).any(axis=3)
+        # Stable sort puts valid points first without changing their order
+        order = np.argsort(~valid, axis=2, kind="stable")
+        self.points = np.take_along_axis(raw, order[..., None], axis=2)
+        self.points[~np.take_along_axis(valid, order, axis=2)] = np.nan
+        self.counts = valid.sum(axis=2)
+
+        # Shoelace over each outline's first count points, wrapping from the last valid point to the first
+        in_outline = np.arange(OUTLINE_POINTS) < self.counts[..., None]
+        following = (np.arange(OUTLINE_POINTS) + 1) % np.maximum(self.counts, 1)[..., None]
+        x, y = self.points[..., 0], self.points[..., 1]
+        x_next = np.take_along_axis(x, following, axis=2)
+        y_next = np.take_along_axis(y, following, axis=2)
+        cross = np.where(in_outline, x * y_next - x_next * y, 0.0)
+        self.areas = np.abs(cross.sum(axis=2)) / 2 / 1e6
+        self.areas[self.counts < 3] = np.nan
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # All-NaN outlines give NaN boxes
+            self.bbox = np.concatenate([np.nanmin(self.points, axis=2), np.nanmax(self.points, axis=2)], axis=2)
+
+        for array in (self.points, self.counts, self.areas, self.bbox):
+            array.flags.writeable = False
+
+    def take(self, positions, outline):
+        """(points, counts, bbox) of one outline for the given rows: shapes (n, 5, 2), (n,) and (n, 4)."""
+        positions = np.asarray(positions, dtype=np.intp)
+        return self.points[positions, outline], self.counts[positions, outline], self.bbox[positions, outline]
+
+
+def check_outline_areas(geometry, numeric, tolerance=AREA_TOLERANCE, area_columns=OUTLINE_AREA_COLUMNS):
+    """Rows whose outline area differs from the reported cross section area by more than tolerance.
+
+    area_columns maps outline numbers to the reported area headers. Returns a DataFrame with the row
+    position, outline name, both areas and the relative difference.
+    """
+    frames = []
+    for outline, col in area_columns.items():
+        if col is None or col not in numeric:
+            continue
+        reported = numeric.values[col]
+        computed = geometry.areas[:, outline]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            difference = np.abs(computed - reported) / reported
+        rows = np.flatnonzero(difference > tolerance)
+        frames.append(pd.DataFrame({
+            "Row": rows,
+            "Outline": OUTLINE_NAMES[outline],
+            "Reported [m2]": reported[rows],
+            "Outline [m2]": computed[rows],
+            "Difference [%]": difference[rows] * 100,
+        }))
+    if not frames:
+        return pd.DataFrame(columns=["Row", "Outline", "Reported [m2]", "Outline [m2]", "Difference [%]"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# --- Area vs Size Cohorts ---
+AREA_FAMILY_COLUMNS = ["Year", "Quarter", "Region", "Brand name", "Unit name", "Recovery type"]
+# Which column narrows a family to one variant, per recovery type
+AREA_VARIANT_COLUMNS = {"RRG": "Type", "HEX": "Material", "PCR": "Material"}
+
+
+class AreaCohorts:
+    """The sizes of every unit family with their cross section areas, precomputed for the area-vs-size chart.
+
+    A family key is (year, quarter, region, brand, unit name, recovery type, variant), where variant
+    is a Type (RRG) or Material (HEX/PCR) value, or None for all variants. get() returns the family's
+    (sizes, areas) arrays: distinct (size, area) pairs with a positive area, sorted by area. The column
+    arguments take the workbook headers the canonical names resolved to.
+    """
+
+    def __init__(self, df, areas, size_column="Unit size", family_columns=AREA_FAMILY_COLUMNS,
+                 variant_columns=AREA_VARIANT_COLUMNS):
+        self.families = {}
+        if areas is None or size_column not in df.columns or not all(c in df.columns for c in family_columns):
+            return
+        sizes = df[size_column].to_numpy()
+
+        def cohort(positions):
+            pairs = dict.fromkeys((sizes[p], areas[p]) for p in positions if areas[p] > 0)
+            family_sizes = np.array([size for size, _ in pairs], dtype=object)
+            family_areas = np.array([area for _, area in pairs], dtype=np.float64)
+            order = np.argsort(family_areas, kind="stable")
+            return family_sizes[order], family_areas[order]
+
+        for key, positions in df.groupby(list(family_columns), sort=False).indices.items():
+            self.families[key + (None,)] = cohort(positions)
+            variant_column = variant_columns.get(key[-1])
+            if variant_column in df.columns:
+                variants = df[variant_column].to_numpy()[positions]
+                for variant in pd.unique(variants[pd.notna(variants)]):
+                    self.families[key + (variant,)] = cohort(positions[variants == variant])
+
+    def get(self, key):
+        return self.families.get(key)
+
+
+# --- Figure Cache ---
+class FigureCache:
+    """Bounded LRU of built chart figures with hit/miss counters, shared by all sessions.
+
+    Keys are fingerprints such as (dataset version, chart id, selection fields). Cached figures are
+    handed out as they are, so callers must not modify them. Empty charts (None) are cached too.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """Cached value for key, or build() stored under it."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+
+# --- Selected Unit Records ---
+class ColumnArrays:
+    """One NumPy array per table column, converted on first use, for positional reads without pandas indexing.
+
+    Columns are addressed by position (as compiled by CompiledSchema); column() also takes a header.
+    """
+
+    def __init__(self, df):
+        self._df = df
+        self._positions = {col: i for i, col in enumerate(df.columns)}
+        self._arrays = [None] * len(df.columns)
+
+    def __contains__(self, col):
+        return col in self._positions
+
+    def column(self, col):
+        position = col if isinstance(col, (int, np.integer)) else self._positions[col]
+        array = self._arrays[position]
+        if array is None:
+            array = self._df.iloc[:, position].to_numpy()
+            array.flags.writeable = False
+            self._arrays[position] = array
+        return array
+
+
+class UnitRecord:
+    """A selected competitor unit: its row position in the shared table and the cells read from it so far.
+
+    position is None when the selection matched no unit. get() returns plain Python/NumPy scalars taken
+    from the column arrays and number() the float of a unit-suffixed column; each is read at most once.
+    """
+
+    __slots__ = ("position", "version", "_columns", "_numeric", "_values", "_numbers")
+
+    def __init__(self, columns, numeric, position, version):
+        self.position = position
+        self.version = version
+        self._columns = columns
+        self._numeric = numeric
+        self._values = {}
+        self._numbers = {}
+
+    @property
+    def empty(self):
+        return self.position is None
+
+    def get(self, col, default=None):
+        """Value of col (a header or column position) for this unit; default if there is no unit or no such column."""
+        if self.position is None or col is None or (not isinstance(col, (int, np.integer)) and col not in self._columns):
+            return default
+        if col not in self._values:
+            self._values[col] = self._columns.column(col)[self.position]
+        return self._values[col]
+
+    def number(self, col):
+        """Float value of a unit-suffixed column, NaN if there is no unit or the cell is not numeric."""
+        if col not in self._numbers:
+            self._numbers[col] = self._numeric.value(col, self.position)
+        return self._numbers[col]
+
+
+# --- Params x Units Matrix ---
+class ParamMatrix:
+    """Raw and display-formatted values of a list of parameters (columns) for the compared units.
+
+    raw and text have shape (params, units); present marks the units that matched a row. Built once per
+    selection from the unit records, so sections and exports index it instead of the table.
+    """
+
+    def __init__(self, units, params, formatter=str):
+        # params maps each parameter header to its column position
+        self.params = list(params)
+        self.index = {param: r for r, param in enumerate(self.params)}
+        self.present = np.array([not unit.empty for unit in units], dtype=bool)
+        self.raw = np.full((len(self.params), len(units)), None, dtype=object)
+        for u, unit in enumerate(units):
+            if not unit.empty:
+                for r, column_position in enumerate(params.values()):
+                    self.raw[r, u] = unit.get(column_position)
+        self.text = np.vectorize(formatter, otypes=[object])(self.raw) if self.raw.size else self.raw.copy()
+
+    def rows(self, params):
+        """Matrix row indices of the given parameters, skipping those not in the matrix."""
+        return [self.index[p] for p in params if p in self.index]
+
+    def to_frame(self, headers):
+        """Raw values as a DataFrame with one row per parameter and one column per unit (for export)."""
+        return pd.DataFrame(self.raw, index=pd.Index(self.params, name="Parameter"), columns=headers)
+
+
+# --- Shared Read-Only Dataset ---
+FROZEN_MESSAGE = "The shared dataset is read-only; call .copy() before modifying it."
+
+
+class _ReadOnlyIndexer:
+    """Wraps .loc/.iloc/.at/.iat so lookups work but assignments raise."""
+
+    __slots__ = ("_indexer",)
+
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __setitem__(self, key, value):
+        raise TypeError(FROZEN_MESSAGE)
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+
+class FrozenFrame(pd.DataFrame):
+    """DataFrame shared between sessions; in-place mutation raises TypeError.
+
+    Anything derived from it (filters, .iloc slices, .copy()) is a plain, writable DataFrame.
+    """
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(FROZEN_MESSAGE)
+
+    __setitem__ = __delitem__ = insert = pop = _update_inplace = _readonly
+
+    def __setattr__(self, name, value):
+        if name in ("columns", "index"):
+            raise TypeError(FROZEN_MESSAGE)
+        super().__setattr__(name, value)
+
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+
+def freeze_frame(df):
+    """Wraps df without copying and marks its NumPy buffers read-only (Arrow buffers already are)."""
+    frozen = FrozenFrame(df, copy=False)
+    for block in frozen._mgr.blocks:
+        if isinstance(block.values, np.ndarray):
+            block.values.flags.writeable = False
+    return frozen
+
+
+class Dataset:
+    """Market and competitor tables loaded once per process and shared by every session.
+
+    version is the tuple of workbook content hashes; anything derived from the tables
+    (column schema, indexes, option lists, figures) is keyed by it. backend picks how the cascade
+    filters run: in-memory bitmaps (default) or SQL against a DuckDB file (see DuckDBStore).
+    """
+
+    def __init__(self, market, competitor, version, backend="bitmap"):
+        if backend not in QUERY_BACKENDS:
+            raise ValueError(f"Unknown query backend {backend!r}; expected one of {QUERY_BACKENDS}")
+        self.market = freeze_frame(market)
+        self.competitor = freeze_frame(competitor)
+        self.version = version
+        self.schema = CompiledSchema(self.market.columns, self.competitor.columns)
+        self.competitor_numeric = NumericColumns(self.competitor)
+        self.market_columns = ColumnArrays(self.market)
+        self.competitor_columns = ColumnArrays(self.competitor)
+
+        # Everything below is built on the headers the canonical names resolved to
+        market_col = self.schema.market_column
+        comp_col = self.schema.competitor_column
+        self.competitor_geometry = OutlineGeometry(self.competitor, self.schema.coordinates)
+        area_columns = {outline: comp_col(name) for outline, name in OUTLINE_AREA_COLUMNS.items()}
+        self.competitor_area_issues = check_outline_areas(
+            self.competitor_geometry, self.competitor_numeric, area_columns=area_columns
+        )
+        self.competitor_area_cohorts = AreaCohorts(
+            self.competitor,
+            self.competitor_numeric.values.get(area_columns[0]),
+            size_column=comp_col("Unit size"),
+            family_columns=[comp_col(name) for name in AREA_FAMILY_COLUMNS],
+            variant_columns={recovery: comp_col(name) for recovery, name in AREA_VARIANT_COLUMNS.items()},
+        )
+
+        market_cascade = [col for col in map(market_col, MARKET_CASCADE_COLUMNS) if col]
+        competitor_cascade = [col for col in map(comp_col, COMPETITOR_CASCADE_COLUMNS) if col]
+        self.backend = backend
+        if backend == "duckdb" and duckdb is None:
+            warnings.warn("duckdb is not installed; falling back to the bitmap query backend")
+            self.backend = "bitmap"
+        if self.backend == "duckdb":
+            self.store = DuckDBStore({
+                "market": (self.market, market_cascade),
+                "competitor": (self.competitor, competitor_cascade),
+            }, version)
+            self.market_index = DuckDBIndex(self.store, "market", self.market, market_cascade)
+            self.competitor_index = DuckDBIndex(self.store, "competitor", self.competitor, competitor_cascade)
+        else:
+            self.store = None
+            self.market_index = BitmapIndex(self.market, market_cascade)
+            self.competitor_index = BitmapIndex(self.competitor, competitor_cascade)
+
+        # Year -> Quarter -> Region -> Country/Brand, in both orders since either can be picked first
+        self.market_options_by_country = OptionTree(
+            self.market, [market_col(name) for name in ["Year", "Quarter", "Region", "Country", "Brand name"]]
+        )
+        self.market_options_by_brand = OptionTree(
+            self.market, [market_col(name) for name in ["Year", "Quarter", "Region", "Brand name", "Country"]]
+        )
+        # Year -> Quarter -> Region -> Brand -> Unit name -> Recovery type -> Unit size -> Type/Material
+        self.competitor_options = OptionTree(
+            self.competitor,
+            [comp_col(name) for name in ["Year", "Quarter", "Region", "Brand name", "Unit name", "Recovery type", "Unit size"]],
+            leaf_columns=[comp_col("Type"), comp_col("Material")],
+        )
+
+    def unit_record(self, position):
+        """Record of one competitor row position (None for a selection that matched no unit)."""
+        return UnitRecord(self.competitor_columns, self.competitor_numeric, position, self.version)
+
+
+class PartitionedDataset:
+    """Datasets of single Year/Quarter/Region partitions, built on first use and kept in an LRU.
+
+    Only the partition catalogs are read up front; options() serves the Year -> Quarter -> Region
+    dropdowns from the market catalog. get(key) returns the Dataset of one partition, whose version
+    is the workbook hashes followed by the key, so caches keyed by it never mix partitions. At most
+    max_partitions Datasets are held; the least recently used one is dropped first. A cold partition
+    is built outside the shared lock, so only sessions waiting for that same partition block on it.
+    """
+
+    def __init__(self, market, competitor, version, backend="bitmap", max_partitions=8):
+        self.market = market
+        self.competitor = competitor
+        self.version = version
+        self.backend = backend
+        self.max_partitions = max_partitions
+        self.schema = CompiledSchema(market.columns, competitor.columns)
+        self.hits = 0
+        self.misses = 0
+        self._options = OptionTree(pd.DataFrame(market.keys(), columns=PARTITION_COLUMNS), PARTITION_COLUMNS)
+        self._datasets = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def options(self, path=()):
+        return self._options.options(path)
+
+    def keys(self):
+        """Partition keys present in either table."""
+        return sorted(set(self.market.keys()) | set(self.competitor.keys()), key=repr)
+
+    def get(self, key):
+        key = partition_key(key)
+        with self._lock:
+            if key in self._datasets:
+                self._datasets.move_to_end(key)
+                self.hits += 1
+                return self._datasets[key]
+            building = self._building.setdefault(key, threading.Lock())
+
+        # Only sessions asking for this same cold partition wait here; hot partitions stay served
+        with building:
+            with self._lock:
+                if key in self._datasets:  # Built by the session we waited for
+                    self._datasets.move_to_end(key)
+                    self.hits += 1
+                    return self._datasets[key]
+                self.misses += 1
+            try:
+                dataset = Dataset(self.market.read(key), self.competitor.read(key), self.version + key, self.backend)
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            with self._lock:
+                self._datasets[key] = dataset
+                self._building.pop(key, None)
+                while len(self._datasets) > self.max_partitions:
+                    self._datasets.popitem(last=False)
+            return dataset
+
+    def __len__(self):
+        return len(self._datasets)
+
+
+# --- Snapshot Catalog ---
+# Every workbook version ever ingested stays on disk as immutable, content-addressed partitions;
+# catalog.json lists them and the dataset snapshots (market + competitor version pairs) built from them
+SNAPSHOT_CATALOG = "catalog.json"
+
+
+def natural_key(name):
+    """Sort key putting 'Data_2025_9' before 'Data_2025_10'."""
+    return [int(part) if part.isdigit() else part.casefold() for part in re.split(r"(\d+)", str(name))]
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on path (created if needed) across processes; a no-op where locking is unsupported."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SnapshotCatalog:
+    """Ingested workbook versions and the dataset snapshots built from them, persisted as JSON.
+
+    ingest() partitions one workbook version (once per content hash) and records it; record() adds a
+    snapshot pairing a market and a competitor version. Every change re-reads catalog.json under a
+    file lock and merges it first, so entries written by other processes are kept. open() returns the
+    PartitionedDataset of a snapshot without reading any rows, so old snapshots cost disk until a
+    session browses them; it raises FileNotFoundError when a snapshot's partitions are gone.
+    """
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.path = os.path.join(snapshot_dir, SNAPSHOT_CATALOG)
+        self.workbooks = []
+        self.snapshots = []
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._merge(self._read())
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                catalog = json.load(f)
+            return catalog["workbooks"], catalog["snapshots"]
+        except (OSError, ValueError, KeyError):
+            return [], []
+
+    def _merge(self, catalog):
+        # Entries are immutable: keep everything on disk, then add what only this process has recorded
+        workbooks, snapshots = catalog
+        on_disk = {(entry["kind"], entry["hash"]) for entry in workbooks}
+        self.workbooks = workbooks + [e for e in self.workbooks if (e["kind"], e["hash"]) not in on_disk]
+        on_disk = {snapshot["id"] for snapshot in snapshots}
+        self.snapshots = snapshots + [s for s in self.snapshots if s["id"] not in on_disk]
+
+    def _write(self):
+        # Versions held in memory only (no partitions on disk) stay out of the file, with the snapshots using them
+        workbooks = [entry for entry in self.workbooks if entry["root"] is not None]
+        stored = {(entry["kind"], entry["hash"]) for entry in workbooks}
+        snapshots = [
+            snapshot for snapshot in self.snapshots
+            if ("market", snapshot["market"]) in stored and ("competitor", snapshot["competitor"]) in stored
+        ]
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"workbooks": workbooks, "snapshots": snapshots}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # Read-only deployment: the catalog lives for this process only
+
+    @contextmanager
+    def _updating(self):
+        """Merges the catalog on disk, lets the caller add entries, then writes the result back."""
+        with self._lock, ExitStack() as stack:
+            try:
+                stack.enter_context(_file_lock(self.path + ".lock"))
+            except OSError:
+                pass  # Read-only deployment: nothing to share the file with
+            self._merge(self._read())
+            yield
+            self._write()
+
+    def workbook(self, kind, content_hash):
+        for entry in self.workbooks:
+            if entry["kind"] == kind and entry["hash"] == content_hash:
+                return entry
+        return None
+
+    def ingest(self, kind, path, sheet_name=0):
+        """Partitions one workbook version if it is new and returns its catalog entry."""
+        table, content_hash = load_partitioned_table(path, sheet_name, self.snapshot_dir)
+        self._tables[(kind, content_hash)] = table
+        with self._updating():
+            entry = self.workbook(kind, content_hash)
+            if entry is None:
+                entry = {
+                    "kind": kind, "file": os.path.basename(path), "sheet": sheet_name, "hash": content_hash,
+                    "root": table.root, "rows": sum(table.partitions.values()),
+                    "ingested": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                self.workbooks.append(entry)
+            elif table.root is not None and entry["root"] != table.root:
+                entry["root"] = table.root  # Partitions written since, or moved to a new location
+        return entry
+
+    def record(self, market_hash, competitor_hash):
+        """Id of the snapshot pairing two ingested versions, adding it if the pair is new."""
+        snapshot_id = f"{market_hash[:10]}-{competitor_hash[:10]}"
+        with self._updating():
+            if self.snapshot(snapshot_id) is None:
+                market = self.workbook("market", market_hash)
+                competitor = self.workbook("competitor", competitor_hash)
+                self.snapshots.append({
+                    "id": snapshot_id, "market": market_hash, "competitor": competitor_hash,
+                    "label": f"{os.path.splitext(market['file'])[0]} + {os.path.splitext(competitor['file'])[0]}",
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+        return snapshot_id
+
+    def snapshot(self, snapshot_id):
+        for snapshot in self.snapshots:
+            if snapshot["id"] == snapshot_id:
+                return snapshot
+        return None
+
+    def _table(self, kind, content_hash):
+        if (kind, content_hash) in self._tables:
+            return self._tables[(kind, content_hash)]
+        entry = self.workbook(kind, content_hash)
+        try:
+            return PartitionedTable(entry["root"])
+        except (OSError, ValueError, KeyError, TypeError):
+            name = entry["file"] if entry else content_hash[:16]
+            raise FileNotFoundError(
+                f"The stored partitions of {kind} workbook {name} ({content_hash[:16]}) are missing or damaged"
+            ) from None
+
+    def open(self, snapshot_id, backend="bitmap", max_partitions=8):
+        """PartitionedDataset of one snapshot; only its partition catalogs are read."""
+        snapshot = self.snapshot(snapshot_id)
+        if snapshot is None:
+            raise FileNotFoundError(f"Snapshot {snapshot_id} is not in the catalog")
+        return PartitionedDataset(
+            self._table("market", snapshot["market"]), self._table("competitor", snapshot["competitor"]),
+            (snapshot["market"], snapshot["competitor"]), backend, max_partitions,
+        )
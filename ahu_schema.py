@@ -0,0 +1,269 @@
+import re
+
+# --- Column Aliases ---
+# Canonical header -> other headers the same data has been published under in the workbooks
+COLUMN_ALIASES = {
+    "Rotor diameter [mm]": ["Wheel diameter [mm]"],
+}
+
+# --- Named Columns ---
+# Columns the app reads by name, outside the section tables
+MARKET_COLUMNS = ["Quarter", "Year", "Region", "Country", "Brand name", "Country Flag", "Brand logo"]
+
+COMPETITOR_COLUMNS = [
+    "Unit name", "Region", "Year", "Quarter", "Recovery type", "Unit size", "Brand name", "Brand logo", "Unit photo",
+    "Type", "Material",
+    "Unit cross section area (Supply Filter) [m2]", "Unit cross section area (Supply Fan) [m2]",
+    "Duct connection Diameter [mm]",
+    "Capacity range1 [kW]", "Capacity range2 [kW]", "Capacity range3 [kW]",
+]
+
+# Market overview grid rows in display order: (canonical market header, row label)
+MARKET_OVERVIEW = [
+    ("Country", "Country"), ("Country Flag", "Flag"), ("Brand name", "Brand"), ("Brand logo", "Logo"),
+    ("Market information", "Market Information"), ("Technical demand", "Technical Demand"),
+    ("Company profile", "Company Profile"), ("Factories", "Factories"),
+    ("Factory in domestic market", "Local Factory"), ("Sales structure", "Sales Structure"),
+    ("Own sales structure in domestic market", "Local Sales Office"),
+    ("Yearly sales & product value", "Yearly Sales"), ("Product types", "Product Types"),
+    ("Compact units", "Compact Units"), ("Compact units. Technical information", "Compact Unit Details"),
+    ("Compact units. Automatics / Controller", "Compact units. Automatics / Controller"),
+    ("Compact units. Certifications & Standards", "Compact Unit Certs."),
+    ("After sales / Service", "After Sales/Service"), ("Own service in domestic market", "Local Service"),
+    ("Comments", "Comments"), ("Technical barriers", "Technical Barriers"), ("Trade fairs", "Trade Fairs"),
+]
+
+# Outline coordinates are plotted, never listed in the tables
+COORDINATE_COLUMNS = [f"{axis}{i}" for i in range(1, 16) for axis in "xy"]
+
+# --- Technical Sections ---
+# Section tables in display order: the rows are canonical competitor headers, the charts ids in CHART_BUILDERS
+SECTION_SCHEMA = [
+    {
+        "title": "General information",
+        "rows": ["Unit type", "Execution", "Unit size quantity"],
+        "charts": ["chart_area_vs_size"],
+    },
+    {
+        "title": "Internal dimensions & Duct connections",
+        "rows": [
+            "Internal Width (Supply Filter) [mm]",
+            "Internal Height (Supply Filter) [mm]",
+            "Unit cross section area (Supply Filter) [m2]",
+            "Internal Width (Supply Fan) [mm]",
+            "Internal Height (Supply Fan) [mm]",
+            "Unit cross section area (Supply Fan) [m2]",
+            "Duct connection Width [mm]",
+            "Duct connection Height [mm]",
+            "Duct connection Diameter [mm]",
+        ],
+        "charts": ["chart1", "chart2", "chart3"],
+    },
+    {
+        "title": "Certification data",
+        "rows": [
+            "Eurovent Certificate",
+            "Eurovent Model Box",
+            "Casing Strength (Eurovent)",
+            "Casing leakage, negative pressure (Eurovent)",
+            "Casing leakage, positive pressure (Eurovent)",
+            "Filter mounting leakage (Eurovent)",
+            "Thermal isolation (Eurovent)",
+            "Thermal bridges (Eurovent)",
+            "VDI 6022-1 certification",
+        ],
+        "charts": [],
+    },
+    {
+        "title": "Available configurations",
+        "rows": [
+            "Supply",
+            "Exhaust",
+            "Supply/Exhaust without recovery",
+            "Supply/Exhaust with RRG",
+            "Supply/Exhaust with PCR (HEX)",
+            "Supply/Exhaust with glycol",
+        ],
+        "charts": [],
+    },
+    {
+        "title": "Casing",
+        "rows": [
+            "Insulation material",
+            "Insulation thickness [mm]",
+            "Metal sheet (Internal)",
+            "Metal sheet thickness (Internal) [mm]",
+            "Metal sheet (External)",
+            "Metal sheet thickness (External) [mm]",
+        ],
+        "charts": [],
+    },
+    {
+        "title": "Airflows",
+        "rows": [
+            "Minimum airflow [CMH]",
+            "Maximum airflow (CCOL) [CMH]",
+            "Optimal airflow (ErP2018) [CMH]",
+            "Air speed on Filter at opt airflow (ErP) [m/s]",
+        ],
+        "charts": [],
+    },
+    {
+        # Hidden when every compared unit is HEX/PCR
+        "title": "Rotary wheel",
+        "rows": [
+            "Type",
+            "Rotor diameter [mm]",
+            "Distance between lamels [mm]",
+            "Sens. efficiency at opt balanced airflows (ErP)_RRG [%]",
+        ],
+        "charts": [],
+    },
+    {
+        # Hidden when every compared unit is RRG
+        "title": "PCR/HEX recovery exchanger",
+        "rows": [
+            "Material",
+            "Sens. efficiency at nominal balanced airflows_PCR/HEX [%]",
+            "Efficiency-HEX/PCR",
+            "Fan power-HEX/PCR",
+        ],
+        "charts": [],
+    },
+    {
+        "title": "Fan section data",
+        "rows": [
+            "Motor type",
+            "Motor quantity",
+            "Motor rated power [kW]",
+            "Impeller size (available optins)",
+            "Impeller efficiency at optimal airflow [%]",
+        ],
+        "charts": [],
+    },
+    {
+        "title": "Electrical heater",
+        "rows": ["Heating elements type"],
+        "charts": ["electrical_heater_chart"],
+    },
+    {
+        "title": "Water heater",
+        "rows": ["Water heater_min rows", "Water heater_max rows"],
+        "charts": [],
+    },
+    {
+        "title": "Water cooler",
+        "rows": ["Water cooler_min rows", "Water cooler_max rows"],
+        "charts": [],
+    },
+    {
+        "title": "DX/DXH cooler",
+        "rows": ["DXH_min rows", "DXH_max rows"],
+        "charts": [],
+    },
+    {
+        "title": "Supply Filter",
+        "rows": ["Filter type_Supply", "Filter size_Supply [mm]", "Media area_Supply [m2]", "Weight_Supply [kg]"],
+        "charts": [],
+    },
+    {
+        "title": "Exhaust Filter",
+        "rows": ["Filter type_Exhaust", "Filter size_Exhaust [mm]", "Media area_Exhaust [m2]", "Weight_Exhaust [kg]"],
+        "charts": [],
+    },
+    {
+        "title": "Silencer data",
+        "rows": ["Silencer casing", "Silencer length [mm]"],
+        "charts": [],
+    },
+    {
+        "title": "Construction details",
+        "rows": ["Base frame/Feets height [mm]", "Cabling"],
+        "charts": [],
+    },
+]
+
+
+# --- Header Matching ---
+def normalise_header(name):
+    """Header text for matching: case-folded, runs of whitespace collapsed, no spaces inside brackets."""
+    name = re.sub(r"\s+", " ", str(name)).strip().casefold()
+    return re.sub(r"\[\s*(.*?)\s*\]", r"[\1]", name)
+
+
+class ColumnResolver:
+    """Finds the workbook header for a canonical name: exact, then via its aliases, then normalised."""
+
+    def __init__(self, columns):
+        self._exact = set(columns)
+        self._normalised = {}
+        for col in columns:
+            self._normalised.setdefault(normalise_header(col), col)
+
+    def resolve(self, name):
+        candidates = [name] + COLUMN_ALIASES.get(name, [])
+        for candidate in candidates:
+            if candidate in self._exact:
+                return candidate
+        for candidate in candidates:
+            match = self._normalised.get(normalise_header(candidate))
+            if match is not None:
+                return match
+        return None
+
+
+class CompiledSchema:
+    """Every column the app uses, resolved once against the workbook headers of one dataset version.
+
+    market and competitor map canonical names to the actual headers (None when missing), and
+    market_positions / competitor_positions map those headers to their column positions, so the
+    column arrays are indexed by position. sections is SECTION_SCHEMA with each row replaced by its
+    resolved header (unresolved rows dropped); market_overview lists (header, position, label) of the
+    overview grid. unresolved lists (where, canonical name) for
+    everything that could not be matched.
+    """
+
+    def __init__(self, market_columns, competitor_columns):
+        market = ColumnResolver(market_columns)
+        competitor = ColumnResolver(competitor_columns)
+        self.market_positions = {col: i for i, col in enumerate(market_columns)}
+        self.competitor_positions = {col: i for i, col in enumerate(competitor_columns)}
+        self.market = {name: market.resolve(name) for name in MARKET_COLUMNS}
+        self.competitor = {name: competitor.resolve(name) for name in COMPETITOR_COLUMNS}
+        self.coordinates = {name: competitor.resolve(name) for name in COORDINATE_COLUMNS}
+        self.unresolved = [("Market", name) for name, col in self.market.items() if col is None]
+        self.unresolved += [("Competitor", name) for name, col in self.competitor.items() if col is None]
+        self.unresolved += [("Outline", name) for name, col in self.coordinates.items() if col is None]
+
+        self.market_overview = []
+        for name, label in MARKET_OVERVIEW:
+            col = self.market.get(name) or market.resolve(name)
+            if col is None:
+                self.unresolved.append(("Market overview", name))
+            else:
+                self.market_overview.append((col, self.market_positions[col], label))
+
+        self.sections = []
+        for section in SECTION_SCHEMA:
+            rows = []
+            for name in section["rows"]:
+                col = self.competitor.get(name) or competitor.resolve(name)
+                if col is None:
+                    self.unresolved.append((section["title"], name))
+                elif col not in rows:
+                    rows.append(col)
+            self.sections.append(dict(section, rows=rows))
+
+        self.coordinate_columns = {col for col in self.coordinates.values() if col}
+        # Section rows in display order, each once; outline coordinates are never listed
+        self.table_columns = list(dict.fromkeys(
+            col for section in self.sections for col in section["rows"] if col not in self.coordinate_columns
+        ))
+
+    def market_column(self, name):
+        """Resolved market header of a canonical name compiled above (None when missing)."""
+        return self.market.get(name)
+
+    def competitor_column(self, name):
+        """Resolved competitor header of a canonical name compiled above (None when missing)."""
+        return self.competitor.get(name) or self.coordinates.get(name)
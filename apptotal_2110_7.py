@@ -1,111 +1,382 @@
+import base64
+import glob
+import html
+import io
+import os
 import streamlit as st
 import pandas as pd
 from PIL import Image
 import plotly.express as px
 import plotly.graph_objects as go 
+import plotly.io as pio
 import numpy as np
+from ahu_assets import (
+    IMAGE_DIR, LOGO_OVERVIEW_WIDTH, LOGO_WIDTH, PHOTO_WIDTH, STATIC_BASE_URL, STATIC_THUMBNAIL_DIR, THUMBNAIL_DIR,
+    ImageManifest, ThumbnailStore,
+)
+from ahu_data import (
+    AREA_TOLERANCE, QUERY_BACKENDS, FigureCache, ParamMatrix, PartitionedDataset, PartitionedTable, SnapshotCatalog,
+    compare_ingest, file_content_hash, natural_key,
+)
 
 # --- Page Configuration ---
 st.set_page_config(layout="wide")
 
+# Every workbook version in the app folder is ingested, e.g. "Data_Market analysis_2025_9.xlsx" and "Data_2025_2.xlsx"
+MARKET_WORKBOOKS = "Data_Market analysis_*.xlsx"
+COMPETITOR_WORKBOOKS = "Data_[0-9]*.xlsx"
+
 # --- Data Loading ---
+# Workbooks are parsed once into Arrow snapshots and split into Year/Quarter/Region Parquet partitions
+# (see ahu_data.py). Each version is kept, content-addressed, in the snapshot catalog; a dataset snapshot
+# pairs a market and a competitor version. Only partition catalogs are read when a snapshot is opened;
+# the Dataset of a partition is built when a session first selects it and kept in a process-wide LRU of
+# hot partitions, so every session viewing it shares the same read-only frames.
+def workbook_files(pattern):
+    """(path, size, mtime) of the workbook versions matching pattern, oldest name first."""
+    files = []
+    for path in glob.glob(pattern):
+        stat = os.stat(path)
+        files.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(files, key=lambda f: natural_key(os.path.basename(f[0]))))
+
+@st.cache_resource(max_entries=1, show_spinner="Ingesting workbooks...")
+def load_catalog(market_files, competitor_files):
+    """Ingests new workbook versions and records a snapshot for each, paired with the newest of the other kind.
+
+    The pair of newest versions is recorded last and returned as the latest snapshot.
+    """
+    catalog = SnapshotCatalog()
+    market = [catalog.ingest("market", path) for path, _, _ in market_files]
+    competitor = [catalog.ingest("competitor", path, sheet_name="data") for path, _, _ in competitor_files]
+    if not market or not competitor:
+        return catalog, None
+    for entry in market[:-1]:
+        catalog.record(entry["hash"], competitor[-1]["hash"])
+    for entry in competitor[:-1]:
+        catalog.record(market[-1]["hash"], entry["hash"])
+    return catalog, catalog.record(market[-1]["hash"], competitor[-1]["hash"])
+
 @st.cache_data
-def load_market_data():
+def ingest_report(path, sheet_name, version=None):
+    """Side-by-side timing/memory of pd.read_excel vs. the streaming reader, once per file version."""
+    return compare_ingest(path, sheet_name)
+
+# Cascade filters run on in-memory bitmaps unless AHU_QUERY_BACKEND=duckdb (needs the optional duckdb package)
+QUERY_BACKEND = os.environ.get("AHU_QUERY_BACKEND", "bitmap").strip().lower()
+# Year/Quarter/Region partitions kept loaded per process
+hot_partitions_setting = os.environ.get("AHU_HOT_PARTITIONS", "8").strip()
+
+# A bad setting stops every session with one message instead of a traceback from the data layer
+if QUERY_BACKEND not in QUERY_BACKENDS:
+    st.error(f"AHU_QUERY_BACKEND must be one of {', '.join(QUERY_BACKENDS)}, not '{QUERY_BACKEND}'.")
+    st.stop()
+if not hot_partitions_setting.isdigit() or int(hot_partitions_setting) < 1:
+    st.error(f"AHU_HOT_PARTITIONS must be a whole number of at least 1, not '{hot_partitions_setting}'.")
+    st.stop()
+HOT_PARTITIONS = int(hot_partitions_setting)
+
+@st.cache_resource(max_entries=4)
+def load_snapshot(snapshot_id, backend, max_partitions):
+    """One opened snapshot per id; browsing back to an old snapshot reads its partition catalogs only."""
+    if snapshot_id is None:
+        return PartitionedDataset(PartitionedTable(), PartitionedTable(), (None, None), backend, max_partitions)
+    return catalog.open(snapshot_id, backend, max_partitions)
+
+market_files = workbook_files(MARKET_WORKBOOKS)
+competitor_files = workbook_files(COMPETITOR_WORKBOOKS)
+if not market_files:
+    st.error(f"Market analysis data file not found. Please ensure a '{MARKET_WORKBOOKS}' workbook is available.")
+if not competitor_files:
+    st.error(f"Competitor details data file not found. Please ensure a '{COMPETITOR_WORKBOOKS}' workbook is available.")
+catalog, latest_snapshot = load_catalog(market_files, competitor_files)
+
+# --- Snapshot Selection ---
+# Sessions follow the latest snapshot unless one is pinned; the pin is kept in the URL (?snapshot=<id>)
+# so it survives reloads and can be shared
+with st.sidebar:
+    st.header("Selections")
+    snapshot_ids = [None] + [snapshot["id"] for snapshot in reversed(catalog.snapshots)]
+    if "snapshot" not in st.session_state:
+        pinned = st.query_params.get("snapshot")
+        st.session_state["snapshot"] = pinned if pinned in snapshot_ids else None
+    snapshot_labels = {snapshot["id"]: f"{snapshot['label']} ({snapshot['created'][:10]})" for snapshot in catalog.snapshots}
+    selected_snapshot = st.selectbox(
+        "Data snapshot", snapshot_ids, key="snapshot",
+        format_func=lambda v: f"Latest · {snapshot_labels.get(latest_snapshot, '-')}" if v is None else snapshot_labels[v],
+    )
+    if selected_snapshot is not None:
+        st.query_params["snapshot"] = selected_snapshot
+    elif "snapshot" in st.query_params:
+        del st.query_params["snapshot"]
+
+snapshot_id = selected_snapshot or latest_snapshot
+try:
+    partitioned = load_snapshot(snapshot_id, QUERY_BACKEND, HOT_PARTITIONS)
+except FileNotFoundError as e:
+    # A pinned snapshot whose partitions are gone falls back to the latest one; without that there is nothing to show
+    if snapshot_id == latest_snapshot:
+        st.error(f"{e}.")
+        st.stop()
+    st.error(f"{e}. Showing the latest snapshot instead; pick another data snapshot.")
     try:
-        # Assuming Data_Market analysis_2025_9.xlsx is in the same directory
-        return pd.read_excel("Data_Market analysis_2025_9.xlsx", engine='openpyxl')
-    except FileNotFoundError:
-        st.error("Market analysis data file not found. Please ensure 'Data_Market analysis_2025_9.xlsx' is available.")
-        return pd.DataFrame()
+        partitioned = load_snapshot(latest_snapshot, QUERY_BACKEND, HOT_PARTITIONS)
+    except FileNotFoundError as latest_error:
+        st.error(f"{latest_error}.")
+        st.stop()
 
-@st.cache_data
-def load_competitor_data():
+# --- Helper Functions ---
+def facet_label(value, counts, show_sizes=True):
+    """Dropdown text with the option's competitor counts, e.g. 'Swegon (272 rows · 86 sizes)'."""
+    if value == "(any)":
+        return value
+    rows, sizes = counts.get(value, (0, 0))
+    return f"{value} ({rows} rows · {sizes} sizes)" if show_sizes else f"{value} ({rows} rows)"
+
+# --- Column Mappings ---
+# Resolved once per dataset version against the workbook headers (see ahu_schema); reruns only look them up
+schema = partitioned.schema
+market_cols = schema.market
+comp_cols = schema.competitor
+
+col_market_quarter = market_cols["Quarter"]
+col_market_year = market_cols["Year"]
+col_market_region = market_cols["Region"]
+col_market_country = market_cols["Country"]
+col_market_brand = market_cols["Brand name"]
+col_country_flag = market_cols["Country Flag"]
+col_brand_logo_market = market_cols["Brand logo"]
+
+col_comp_unit_name = comp_cols["Unit name"]
+col_comp_region = comp_cols["Region"]
+col_comp_year = comp_cols["Year"]
+col_comp_quarter = comp_cols["Quarter"]
+col_comp_recovery = comp_cols["Recovery type"]
+col_comp_size = comp_cols["Unit size"]
+col_comp_brand = comp_cols["Brand name"]
+col_comp_logo = comp_cols["Brand logo"]
+col_comp_unit_photo = comp_cols["Unit photo"]
+col_comp_type = comp_cols["Type"]
+col_comp_material = comp_cols["Material"]
+duct_connection_diameter_col = comp_cols["Duct connection Diameter [mm]"]
+capacity_range1_col = comp_cols["Capacity range1 [kW]"]
+capacity_range2_col = comp_cols["Capacity range2 [kW]"]
+capacity_range3_col = comp_cols["Capacity range3 [kW]"]
+
+
+# --- Global Filters ---
+# Year, Quarter and Region pick the partition every comparison works in
+with st.sidebar:
+    num_units = st.slider("Number of comparisons", 2, 10, 2)
+
+    # Common Filters (Used globally and for the new Area vs Size chart)
+    available_years = partitioned.options(())
+    selected_year = st.selectbox("Year", available_years)
+    
+    available_quarters = partitioned.options((selected_year,))
+    selected_quarter = st.selectbox("Quarter", available_quarters)
+
+    available_regions = partitioned.options((selected_year, selected_quarter))
+    selected_region = st.selectbox("Region", available_regions)
+
+dataset = partitioned.get((selected_year, selected_quarter, selected_region))
+df_market = dataset.market
+df_competitor = dataset.competitor
+
+# Dropdown options are dict lookups in the dataset's precomputed option trees (see ahu_data.OptionTree);
+# the selected rows are resolved through its indexes (ahu_data.BitmapIndex, or DuckDBIndex for the duckdb backend)
+market_index = dataset.market_index
+comp_index = dataset.competitor_index
+options_by_country = dataset.market_options_by_country
+options_by_brand = dataset.market_options_by_brand
+comp_options = dataset.competitor_options
+comp_numeric = dataset.competitor_numeric
+market_columns = dataset.market_columns
+comp_geometry = dataset.competitor_geometry
+area_cohorts = dataset.competitor_area_cohorts
+
+
+# --- Image Thumbnails ---
+# With server.enableStaticServing (see .streamlit/config.toml) thumbnails are written to static/ and referenced
+# by URL, so browsers cache them; otherwise their bytes are sent inline with every render.
+# AHU_STATIC_BASE_URL points the URLs at a CDN or reverse proxy that mirrors static/thumbnails with
+# long-lived cache headers (file names are content-hashed, so they never go stale).
+STATIC_IMAGES = bool(st.get_option("server.enableStaticServing"))
+IMAGE_BASE_URL = os.environ.get("AHU_STATIC_BASE_URL", STATIC_BASE_URL).rstrip("/")
+
+@st.cache_resource
+def get_thumbnail_store():
+    """One thumbnail store (and in-memory LRU) per process, shared by all sessions."""
+    return ThumbnailStore(thumbnail_dir=STATIC_THUMBNAIL_DIR if STATIC_IMAGES else THUMBNAIL_DIR)
+
+thumbnails = get_thumbnail_store()
+
+def image_dir_version():
+    """(name, size, mtime) of every file in the images folder from one scan.
+
+    Changes when files are added, removed, renamed or overwritten in place (which leaves the folder's
+    own mtime alone), so an edited logo gets a new manifest and new thumbnails.
+    """
+    files = []
     try:
-        return pd.read_excel("Data_2025_2.xlsx", sheet_name="data", engine='openpyxl')
-    except FileNotFoundError:
-        st.error("Competitor details data file not found. Please ensure 'Data_2025_2.xlsx' is available.")
-        return pd.DataFrame()
+        with os.scandir(IMAGE_DIR) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None
+    return tuple(sorted(files))
+
+@st.cache_resource(max_entries=4, show_spinner="Preparing images...")
+def load_image_manifest(version, image_dir_version):
+    """Resolves every logo, flag and unit photo named anywhere in the snapshot and renders their thumbnails once.
+
+    Only the image columns of each partition are read, so images used by other partitions are not
+    reported as unreferenced. Thumbnails of edited or removed images are deleted first.
+    """
+    market_images = partitioned.market.read_columns([col for col in (col_country_flag, col_brand_logo_market) if col])
+    competitor_images = partitioned.competitor.read_columns([col for col in (col_comp_logo, col_comp_unit_photo) if col])
+    references = {}
+    for label, df, col in [
+        ("Market: Country Flag", market_images, col_country_flag),
+        ("Market: Brand logo", market_images, col_brand_logo_market),
+        ("Competitor: Brand logo", competitor_images, col_comp_logo),
+        ("Competitor: Unit photo", competitor_images, col_comp_unit_photo),
+    ]:
+        if col in df.columns:
+            references[label] = df[col].dropna().astype(str).unique()
+    manifest = ImageManifest(references)
+    thumbnails.register(manifest)
+    thumbnails.prune()
+
+    photos = set(references.get("Competitor: Unit photo", []))
+    thumbnails.prerender([name for name in manifest.images if name not in photos], [LOGO_OVERVIEW_WIDTH, LOGO_WIDTH])
+    thumbnails.prerender([name for name in manifest.images if name in photos], [PHOTO_WIDTH])
+    return manifest
+
+image_manifest = load_image_manifest(partitioned.version, image_dir_version())
+
+
+# --- Figure Cache ---
+@st.cache_resource
+def get_figure_cache():
+    """Built chart figures, shared by all sessions and evicted least recently used first."""
+    return FigureCache(max_entries=256)
+
+figure_cache = get_figure_cache()
+
+
+# --- Comparison Panels ---
+# Each comparison is its own fragment, so a widget change inside it reruns only that panel. The panel keeps
+# its resolved selection in session state and requests a full rerun only when that selection changed; the
+# main area is memoised on the selected rows, so that rerun only rebuilds what depends on this comparison.
+@st.fragment
+def comparison_panel(i, selected_year, selected_quarter, selected_region):
+    region_path = (selected_year, selected_quarter, selected_region)
+    market_bits_region = market_index.intersect({col_market_year: selected_year, col_market_quarter: selected_quarter, col_market_region: selected_region})
+    comp_bits_region = comp_index.intersect({col_comp_year: selected_year, col_comp_quarter: selected_quarter, col_comp_region: selected_region})
+    # Competitor rows and distinct unit sizes per brand under the current Year/Quarter/Region
+    brand_counts = comp_index.facet_counts(col_comp_brand, comp_bits_region, col_comp_size)
+
+    # --- Interconnected Country and Brand Filters ---
+    all_countries = options_by_country.options(region_path)
+    all_brands = options_by_brand.options(region_path)
+
+    selected_country = st.selectbox(f"Country", ["(any)"] + all_countries, key=f"country_{i}")
+    
+    if selected_country != "(any)":
+        brands_in_country = options_by_country.options(region_path + (selected_country,))
+        selected_brand = st.selectbox(f"Brand name", ["(any)"] + brands_in_country, format_func=lambda v, counts=brand_counts: facet_label(v, counts), key=f"brand_{i}")
+    else:
+        selected_brand = st.selectbox(f"Brand name", ["(any)"] + all_brands, format_func=lambda v, counts=brand_counts: facet_label(v, counts), key=f"brand_{i}")
+
+    market_bits_selection = market_index.intersect({
+        col_market_country: selected_country if selected_country != "(any)" else None,
+        col_market_brand: selected_brand if selected_brand != "(any)" else None,
+    }, market_bits_region)
+    market_positions = market_index.positions(market_bits_selection)
+
+    if selected_brand != "(any)" and selected_country == "(any)":
+        countries_for_brand = options_by_brand.options(region_path + (selected_brand,))
+        st.info(f"'{selected_brand}' is available in: {', '.join(countries_for_brand)}")
+
+
+    # --- Competitor Detail Filters (based on brand selection) ---
+    competitor_positions = np.array([], dtype=np.intp)
+    selected_unit = None
+    selected_recovery = None
+    selected_size = None
+    selected_type = None
+    selected_material = None
+    
+    if selected_brand != "(any)":
+        comp_path = region_path + (selected_brand,)
+        facet_bits = comp_index.intersect({col_comp_brand: selected_brand}, comp_bits_region)
+
+        available_units = comp_options.options(comp_path)
+        if available_units:
+            unit_counts = comp_index.facet_counts(col_comp_unit_name, facet_bits, col_comp_size)
+            selected_unit = st.selectbox(f"Unit name", available_units, format_func=lambda v, counts=unit_counts: facet_label(v, counts), key=f"unit_{i}")
+            comp_path += (selected_unit,)
+            facet_bits = comp_index.intersect({col_comp_unit_name: selected_unit}, facet_bits)
+        
+        available_recovery = comp_options.options(comp_path) if selected_unit is not None else []
+        if available_recovery:
+            recovery_counts = comp_index.facet_counts(col_comp_recovery, facet_bits, col_comp_size)
+            selected_recovery = st.selectbox(f"Recovery type", available_recovery, format_func=lambda v, counts=recovery_counts: facet_label(v, counts), key=f"recovery_{i}")
+            comp_path += (selected_recovery,)
+            facet_bits = comp_index.intersect({col_comp_recovery: selected_recovery}, facet_bits)
+
+        available_sizes = comp_options.options(comp_path) if selected_recovery is not None else []
+        if available_sizes:
+            size_counts = comp_index.facet_counts(col_comp_size, facet_bits)
+            selected_size = st.selectbox(f"Unit size", available_sizes, format_func=lambda v, counts=size_counts: facet_label(v, counts, show_sizes=False), key=f"size_{i}")
+            comp_path += (selected_size,)
+            
+            # These positions resolve to the SINGLE ROW for the table details
+            comp_bits = comp_index.intersect({col_comp_size: selected_size}, facet_bits)
+            competitor_positions = comp_index.positions(comp_bits)
 
-df_market = load_market_data()
-df_competitor = load_competitor_data()
+            # Conditional dropdowns for Rotary Wheel Type or Material
+            if selected_recovery == "RRG" and col_comp_type and len(competitor_positions):
+                available_types = comp_options.leaf_options(comp_path, col_comp_type)
+                
+                if comp_index.value_at(col_comp_type, competitor_positions[0]) in available_types:
+                    default_type = comp_index.value_at(col_comp_type, competitor_positions[0])
+                else:
+                    default_type = available_types[0] if available_types else None
+                
+                if available_types:
+                    selected_type = st.selectbox(f"Rotary wheel type", available_types, index=available_types.index(default_type) if default_type in available_types else 0, key=f"type_{i}")
+                    competitor_positions = comp_index.select({col_comp_type: selected_type}, comp_bits)
+                
+            elif selected_recovery in ["HEX", "PCR"] and col_comp_material and len(competitor_positions):
+                available_materials = comp_options.leaf_options(comp_path, col_comp_material)
+                if comp_index.value_at(col_comp_material, competitor_positions[0]) in available_materials:
+                    default_material = comp_index.value_at(col_comp_material, competitor_positions[0])
+                else:
+                    default_material = available_materials[0] if available_materials else None
 
-# --- Helper Functions ---
-def get_column_safe(df, name_options):
-    """Finds the first matching column name in the DataFrame."""
-    for name in name_options:
-        if name in df.columns:
-            return name
-    return None
-
-# --- Column Mappings for Market Data ---
-col_market_quarter = get_column_safe(df_market, ["Quarter"])
-col_market_year = get_column_safe(df_market, ["Year"])
-col_market_region = get_column_safe(df_market, ["Region"])
-col_market_country = get_column_safe(df_market, ["Country"])
-col_market_brand = get_column_safe(df_market, ["Brand name"])
-col_country_flag = get_column_safe(df_market, ["Country Flag"])
-col_brand_logo_market = get_column_safe(df_market, ["Brand logo"])
-
-
-# --- Column Mappings for Competitor Data ---
-col_comp_unit_name = get_column_safe(df_competitor, ["Unit name"])
-col_comp_region = get_column_safe(df_competitor, ["Region"])
-col_comp_year = get_column_safe(df_competitor, ["Year"])
-col_comp_quarter = get_column_safe(df_competitor, ["Quarter"])
-col_comp_recovery = get_column_safe(df_competitor, ["Recovery type"])
-col_comp_size = get_column_safe(df_competitor, ["Unit size"])
-col_comp_brand = get_column_safe(df_competitor, ["Brand name"])
-col_comp_logo = get_column_safe(df_competitor, ["Brand logo"])
-col_comp_unit_photo = get_column_safe(df_competitor, ["Unit photo"])
-
-# NEW COLUMNS FOR GENERAL INFO
-col_comp_unit_type = get_column_safe(df_competitor, ["Unit type"])
-col_comp_execution = get_column_safe(df_competitor, ["Execution"])
-col_comp_unit_size_quantity = get_column_safe(df_competitor, ["Unit size quantity"])
-
-# --- DIMENSIONS (Overall dimensions section) ---
-internal_width_supply_filter_col = get_column_safe(df_competitor, ["Internal Width (Supply Filter) [mm]"])
-internal_height_supply_filter_col = get_column_safe(df_competitor, ["Internal Height (Supply Filter) [mm]"])
-unit_cross_section_area_supply_filter_area_col = get_column_safe(df_competitor, ["Unit cross section area (Supply Filter) [m2]"])
-internal_width_supply_fan_col = get_column_safe(df_competitor, ["Internal Width (Supply Fan) [mm]"])
-internal_height_supply_fan_col = get_column_safe(df_competitor, ["Internal Height (Supply Fan) [mm]"])
-unit_cross_section_area_supply_fan_col = get_column_safe(df_competitor, ["Unit cross section area (Supply Fan) [m2]"])
-col_comp_duct_connection_width = get_column_safe(df_competitor, ["Duct connection Width [mm]"])
-duct_connection_height_col = get_column_safe(df_competitor, ["Duct connection Height [mm]"])
-duct_connection_diameter_col = get_column_safe(df_competitor, ["Duct connection Diameter [mm]"])
-
-# --- ROTARY WHEEL DETAILS ---
-col_comp_type = get_column_safe(df_competitor, ["Type"])
-col_comp_rotor_diameter = get_column_safe(df_competitor, ["Rotor diameter [mm]"])
-col_comp_rotor_distance = get_column_safe(df_competitor, ["Distance between lamels [mm]"])
-col_comp_efficiency_rrg_erp = get_column_safe(df_competitor, ["Sens. efficiency at opt balanced airflows (ErP)_RRG [%]"])
-
-
-# --- FAN SECTION DETAILS ---
-col_comp_motor_type = get_column_safe(df_competitor, ["Motor type"])
-col_comp_motor_quantity = get_column_safe(df_competitor, ["Motor quantity"])
-col_comp_motor_power = get_column_safe(df_competitor, ["Motor rated power [kW]"])
-col_comp_impeller_size = get_column_safe(df_competitor, ["Impeller size (available optins)"])
-col_comp_impeller_efficiency = get_column_safe(df_competitor, ["Impeller efficiency at optimal airflow [%]"])
-
-
-# --- HEATER/OTHER DETAILS ---
-capacity_range1_col = get_column_safe(df_competitor, ["Capacity range1 [kW]"])
-capacity_range2_col = get_column_safe(df_competitor, ["Capacity range2 [kW]"])
-capacity_range3_col = get_column_safe(df_competitor, ["Capacity range3 [kW]"])
-heating_elements_type_col = get_column_safe(df_competitor, ["Heating elements type"])
-
-# Special columns
-col_comp_material = get_column_safe(df_competitor, ["Material"])
-silencer_casing_col = get_column_safe(df_competitor, ["Silencer casing"])
-base_frame_height_col = get_column_safe(df_competitor, ["Base frame/Feets height [mm]"])
-cabling_col = get_column_safe(df_competitor, ["Cabling"])
-
-# Coordinates for shape plots (Excluded from main table rendering)
-coord_col_pairs_1_5 = [(get_column_safe(df_competitor, [f"x{i}"]), get_column_safe(df_competitor, [f"y{i}"])) for i in range(1, 6)]
-coord_col_pairs_6_10 = [(get_column_safe(df_competitor, [f"x{i}"]), get_column_safe(df_competitor, [f"y{i}"])) for i in range(6, 11)]
-coord_col_pairs_11_15 = [(get_column_safe(df_competitor, [f"x{i}"]), get_column_safe(df_competitor, [f"y{i}"])) for i in range(11, 16)]
-coord_cols = [c for pair in coord_col_pairs_1_5 + coord_col_pairs_6_10 + coord_col_pairs_11_15 for c in pair if c]
+                if available_materials:
+                    selected_material = st.selectbox(f"PCR/HEX lamels material", available_materials, index=available_materials.index(default_material) if default_material in available_materials else 0, key=f"material_{i}")
+                    competitor_positions = comp_index.select({col_comp_material: selected_material}, comp_bits)
+    
+    selection = {
+        "country": selected_country, "brand": selected_brand,
+        "unit": selected_unit, "recovery": selected_recovery, "size": selected_size,
+        "type": selected_type, "material": selected_material,
+        # Store the global filters as well for use in the Area chart's query
+        "year": selected_year, "quarter": selected_quarter, "region": selected_region,
+        # Ensure the market selection is narrowed down correctly (taking the first row if multiple match, as market data is usually high level)
+        "market_rows": tuple(int(p) for p in market_positions[:1]),
+        "competitor_rows": tuple(int(p) for p in competitor_positions),
+    }
+    previous = st.session_state.get(f"comparison_{i}")
+    st.session_state[f"comparison_{i}"] = selection
+    if previous != selection and not st.session_state.get("full_run_in_progress", False):
+        st.rerun()
+    return selection
 
 
 # --- App Title ---
@@ -113,179 +384,474 @@ st.title("Market & Competitor Analysis")
 
 # --- Sidebar ---
 with st.sidebar:
-    st.header("Selections")
-    num_units = st.slider("Number of comparisons", 2, 10, 2)
-    
     selections = []
-    filtered_dfs_market = []
-    filtered_dfs_competitor = []
 
-    # Common Filters (Used globally and for the new Area vs Size chart)
-    available_years = sorted(df_market[col_market_year].dropna().unique())
-    selected_year = st.selectbox("Year", available_years)
-    
-    df_filtered_by_year = df_market[df_market[col_market_year] == selected_year]
-    available_quarters = sorted(df_filtered_by_year[col_market_quarter].dropna().unique())
-    selected_quarter = st.selectbox("Quarter", available_quarters)
+    # Reset even when a panel raises, or later panel edits would never trigger the full rerun
+    st.session_state["full_run_in_progress"] = True
+    try:
+        for i in range(num_units):
+            st.markdown("---")
+            with st.expander(f"Comparison {i+1}"):
+                s = comparison_panel(i, selected_year, selected_quarter, selected_region)
+            selections.append(s)
+    finally:
+        st.session_state["full_run_in_progress"] = False
+
+    # --- Data Diagnostics ---
+    st.markdown("---")
+    with st.expander("Data diagnostics"):
+        if st.checkbox("Compare Excel loaders", key="diag_ingest"):
+            # The workbooks of the open snapshot, if they are still in the app folder
+            for label, kind, content_hash in [("Market", "market", partitioned.version[0]), ("Competitor", "competitor", partitioned.version[1])]:
+                entry = catalog.workbook(kind, content_hash)
+                if entry is None:
+                    continue
+                path, sheet = entry["file"], entry["sheet"]
+                try:
+                    if file_content_hash(path) != content_hash:
+                        continue  # Replaced by a newer version under the same name
+                    report = ingest_report(path, sheet, content_hash)
+                except FileNotFoundError:
+                    continue
+                st.markdown(f"**{label}** ({path})")
+                st.dataframe(pd.DataFrame({
+                    "Loader": ["pd.read_excel", "streaming"],
+                    "Seconds": [report["read_excel"]["seconds"], report["streaming"]["seconds"]],
+                    "Columns": [report["read_excel"]["columns"], report["streaming"]["columns"]],
+                    "Memory (KB)": [report["read_excel"]["memory_bytes"] / 1024, report["streaming"]["memory_bytes"] / 1024],
+                }), hide_index=True)
+                st.caption(f"Saved {report['seconds_saved']:.2f} s and {report['memory_saved_bytes'] / 1024:.0f} KB")
+        # Summary lines are always shown; the detail tables are only sent when asked for
+        area_issues = dataset.competitor_area_issues
+        st.caption(
+            f"{sum(comp_numeric.unparsed.values())} non-numeric cells in unit columns ([mm], [kW], ...) · "
+            f"{area_issues['Row'].nunique()} competitor rows with outline areas more than {AREA_TOLERANCE:.0%} "
+            f"off the reported cross section area · {len(schema.unresolved)} schema columns not found"
+        )
+        st.caption(
+            f"Images: {len(image_manifest)} resolved, {len(image_manifest.missing)} missing, "
+            f"{len(image_manifest.unreferenced)} unreferenced in {IMAGE_DIR}/"
+        )
+        if st.checkbox("Show data quality details", key="diag_quality"):
+            if comp_numeric.unparsed:
+                st.dataframe(pd.DataFrame({
+                    "Column": list(comp_numeric.unparsed), "Non-numeric cells": list(comp_numeric.unparsed.values()),
+                }), hide_index=True)
+            if schema.unresolved:
+                st.dataframe(pd.DataFrame(schema.unresolved, columns=["Used by", "Column not found"]), hide_index=True)
+            if not area_issues.empty:
+                context_cols = [c for c in [col_comp_brand, col_comp_unit_name, col_comp_size] if c]
+                st.dataframe(
+                    df_competitor[context_cols].iloc[area_issues["Row"]].reset_index(drop=True).join(area_issues.drop(columns="Row")),
+                    hide_index=True,
+                )
+            if image_manifest.missing:
+                st.dataframe(pd.DataFrame({
+                    "Missing image": list(image_manifest.missing),
+                    "Referenced by": [", ".join(cols) for cols in image_manifest.missing.values()],
+                }), hide_index=True)
+            if image_manifest.unreferenced:
+                st.dataframe(pd.DataFrame({"Unreferenced image": image_manifest.unreferenced}), hide_index=True)
+        cache = thumbnails.cache
+        st.caption(
+            f"Thumbnail cache: {len(cache)} images, {cache.size / 1024:.0f} KB, "
+            f"{cache.hits} hits / {cache.misses} misses"
+        )
+        st.caption(
+            f"Partitions: {selected_year}/{selected_quarter}/{selected_region} "
+            f"({len(df_market)} market, {len(df_competitor)} competitor rows) · "
+            f"{len(partitioned)} of {len(partitioned.keys())} loaded, "
+            f"{partitioned.hits} hits / {partitioned.misses} misses"
+        )
+        st.caption(f"Query backend: {dataset.backend}" + (f" ({dataset.store.path or 'in memory'})" if dataset.store else ""))
+        st.caption(
+            f"Figure cache: {len(figure_cache)} figures, "
+            f"{figure_cache.hits} hits / {figure_cache.misses} misses"
+        )
 
-    df_filtered_by_quarter = df_filtered_by_year[df_filtered_by_year[col_market_quarter] == selected_quarter]
-    available_regions = sorted(df_filtered_by_quarter[col_market_region].dropna().unique())
-    selected_region = st.selectbox("Region", available_regions)
 
-    df_filtered_by_region = df_filtered_by_quarter[df_filtered_by_quarter[col_market_region] == selected_region]
+# --- Main Window ---
 
-    for i in range(num_units):
-        st.markdown("---")
-        with st.expander(f"Comparison {i+1}"):
+# --- Chart Builders ---
+# Each builder takes the selections and their unit records and returns a figure, or None
+# when there is nothing to plot (the section then shows the matching message from CHART_EMPTY_MESSAGES).
+def unit_label(i, s):
+    return f"Unit {i+1}: {s['brand']} - {s['size']}"
+
+def area_cohort_key(s):
+    """Family of units the area-vs-size chart plots for a selection, or None without brand, unit and recovery."""
+    brand, unit, recovery = s.get('brand'), s.get('unit'), s.get('recovery')
+    if not (brand and brand != "(any)" and unit and recovery):
+        return None
+    variant = None
+    if recovery == "RRG" and s.get('type'):
+        variant = s.get('type')
+    elif recovery in ["HEX", "PCR"] and s.get('material'):
+        variant = s.get('material')
+    return (s.get('year'), s.get('quarter'), s.get('region'), brand, unit, recovery, variant)
+
+def build_chart_area_vs_size(selections, units):
+    # --- CHART: Unit Cross Section Area (Supply Filter) vs Unit Size (Scatter) ---
+    # Chart data is one concatenation of the precomputed, area-sorted family arrays
+    cohort_keys = [area_cohort_key(s) for s in selections]
+    cohorts = [(key[3],) + family for key in cohort_keys if key and (family := area_cohorts.get(key))]
+    cohorts = [c for c in cohorts if len(c[1])]
+    if not cohorts:
+        return None
+
+    brands = np.concatenate([np.full(len(sizes), brand, dtype=object) for brand, sizes, _ in cohorts])
+    sizes = np.concatenate([sizes for _, sizes, _ in cohorts])
+    areas = np.concatenate([areas for _, _, areas in cohorts])
+    y_labels = [f"{brand} - {size}" for brand, size in zip(brands, sizes)]
+    unique_y_labels = list(dict.fromkeys(y_labels))
+
+    chart_df = pd.DataFrame({"Y-Label": y_labels, "Area (m²)": areas, "Brand": brands, "Unit Size": sizes})
+    unique_y_labels.reverse() 
+    
+    fig = px.scatter(
+        chart_df, 
+        x="Area (m²)", 
+        y="Y-Label", 
+        color="Brand", 
+        hover_data={"Unit Size": True, "Area (m²)": ":.3f"},
+        title='Unit Cross Section Area (Supply Filter) vs Unit Size',
+        color_discrete_sequence=colors
+    )
+
+    fig.update_traces(marker=dict(size=10, opacity=0.8), mode='markers')
+    
+    fig.update_layout(
+        yaxis={
+            'categoryorder': 'array', 
+            'categoryarray': unique_y_labels,
+            'title': 'Brand and Unit Size' # UPDATED Y-AXIS TITLE
+        },
+        xaxis=dict(range=[0, chart_df['Area (m²)'].max() * 1.15], title='Area (m²)'),
+        height=200 + 30 * len(unique_y_labels)
+    )
+    return fig
+
+def unit_outlines(units, outline):
+    """(index, points, count, bbox) of one outline (0 filter, 1 fan, 2 duct) for every selection with a unit."""
+    indices = [i for i, unit in enumerate(units) if not unit.empty]
+    points, counts, boxes = comp_geometry.take([units[i].position for i in indices], outline)
+    # Coordinates are sent at 0.01 mm: enough for the quarter-millimetre values in the sheet, without float noise
+    return zip(indices, points.round(2), counts, boxes)
+
+def build_outline_chart(selections, units, outline, title):
+    # --- CHART 1 / CHART 2: Internal Cross Section Area (Supply Filter / Supply Fan) Shape ---
+    fig = go.Figure()
+    max_x, max_y = 0, 0
+    
+    for i, unit_points, count, box in unit_outlines(units, outline):
+        if count:
+            label = unit_label(i, selections[i])
+            max_x, max_y = max(max_x, box[2]), max(max_y, box[3])
+            fig.add_trace(go.Scatter(
+                x=unit_points[:count, 0].tolist(), y=unit_points[:count, 1].tolist(), mode='lines+markers', 
+                name=label, 
+                line=dict(color=colors[i % len(colors)]),
+                marker=dict(size=6)
+            ))
         
-            # --- Interconnected Country and Brand Filters ---
-            all_countries = sorted(df_filtered_by_region[col_market_country].dropna().unique())
-            all_brands = sorted(df_filtered_by_region[col_market_brand].dropna().unique())
-
-            selected_country = st.selectbox(f"Country", ["(any)"] + all_countries, key=f"country_{i}")
+    if not fig.data:
+        return None
+
+    fig.update_yaxes(scaleanchor="x", scaleratio=1)
+    fig.update_layout(
+        title=title, 
+        xaxis_title='Width (mm)', 
+        yaxis_title='Height (mm)',
+        xaxis=dict(range=[0, max_x * 1.15]), 
+        yaxis=dict(range=[0, max_y * 1.15]), 
+        hovermode="closest"
+    )
+    return fig
+
+def build_chart_duct_connection(selections, units):
+    # --- CHART 3: Supply Duct Connection Shape ---
+    fig = go.Figure()
+    max_x = 0
+    max_y = 0
+    duct_outlines = {i: (unit_points, count, box) for i, unit_points, count, box in unit_outlines(units, 2)}
+
+    for i in range(len(selections)):
+        if not units[i].empty:
+            diameter = units[i].number(duct_connection_diameter_col)
+            is_circ = diameter > 0
             
-            if selected_country != "(any)":
-                brands_in_country = sorted(df_filtered_by_region[df_filtered_by_region[col_market_country] == selected_country][col_market_brand].dropna().unique())
-                selected_brand = st.selectbox(f"Brand name", ["(any)"] + brands_in_country, key=f"brand_{i}")
-            else:
-                selected_brand = st.selectbox(f"Brand name", ["(any)"] + all_brands, key=f"brand_{i}")
+            label = unit_label(i, selections[i])
 
-            df_market_selection = df_filtered_by_region.copy()
-            
-            if selected_country != "(any)":
-                df_market_selection = df_market_selection[df_market_selection[col_market_country] == selected_country]
-            if selected_brand != "(any)":
-                df_market_selection = df_market_selection[df_market_selection[col_market_brand] == selected_brand]
-                if selected_country == "(any)":
-                    countries_for_brand = sorted(df_market_selection[col_market_country].dropna().unique())
-                    st.info(f"'{selected_brand}' is available in: {', '.join(countries_for_brand)}")
-
-
-            # --- Competitor Detail Filters (based on brand selection) ---
-            df_competitor_selection = pd.DataFrame()
-            selected_unit = None
-            selected_recovery = None
-            selected_size = None
-            selected_type = None
-            selected_material = None
-            
-            if selected_brand != "(any)":
-                df_comp_filtered = df_competitor[
-                    (df_competitor[col_comp_brand] == selected_brand) &
-                    (df_competitor[col_comp_year] == selected_year) &
-                    (df_competitor[col_comp_quarter] == selected_quarter) &
-                    (df_competitor[col_comp_region] == selected_region)
-                ]
-
-                available_units = sorted(df_comp_filtered[col_comp_unit_name].dropna().unique())
-                if available_units:
-                    selected_unit = st.selectbox(f"Unit name", available_units, key=f"unit_{i}")
-                    df_comp_filtered = df_comp_filtered[df_comp_filtered[col_comp_unit_name] == selected_unit]
+            if is_circ:
+                radius = diameter / 2.0
+                color = colors[i % len(colors)]
+                
+                x_center = radius
+                y_center = radius
+                
+                max_x = max(max_x, x_center + radius)
+                max_y = max(max_y, y_center + radius)
                 
-                available_recovery = sorted(df_comp_filtered[col_comp_recovery].dropna().unique())
-                if available_recovery:
-                    selected_recovery = st.selectbox(f"Recovery type", available_recovery, key=f"recovery_{i}")
-                    df_comp_filtered = df_comp_filtered[df_comp_filtered[col_comp_recovery] == selected_recovery]
-
-                available_sizes = sorted(df_comp_filtered[col_comp_size].dropna().unique())
-                if available_sizes:
-                    selected_size = st.selectbox(f"Unit size", available_sizes, key=f"size_{i}")
-                    
-                    # This df_competitor_selection is the SINGLE ROW for the table details
-                    df_competitor_selection = df_comp_filtered[df_comp_filtered[col_comp_size] == selected_size]
-
-                    # Conditional dropdowns for Rotary Wheel Type or Material
-                    if selected_recovery == "RRG" and col_comp_type and not df_competitor_selection.empty:
-                        available_types = sorted(df_competitor_selection[col_comp_type].dropna().unique())
-                        
-                        if df_competitor_selection[col_comp_type].iloc[0] in available_types:
-                            default_type = df_competitor_selection[col_comp_type].iloc[0]
-                        else:
-                            default_type = available_types[0] if available_types else None
-                        
-                        if available_types:
-                            selected_type = st.selectbox(f"Rotary wheel type", available_types, index=available_types.index(default_type) if default_type in available_types else 0, key=f"type_{i}")
-                            df_competitor_selection = df_competitor_selection[df_competitor_selection[col_comp_type] == selected_type]
-                        
-                    elif selected_recovery in ["HEX", "PCR"] and col_comp_material and not df_competitor_selection.empty:
-                        available_materials = sorted(df_competitor_selection[col_comp_material].dropna().unique())
-                        if df_competitor_selection[col_comp_material].iloc[0] in available_materials:
-                            default_material = df_competitor_selection[col_comp_material].iloc[0]
-                        else:
-                            default_material = available_materials[0] if available_materials else None
-
-                        if available_materials:
-                            selected_material = st.selectbox(f"PCR/HEX lamels material", available_materials, index=available_materials.index(default_material) if default_material in available_materials else 0, key=f"material_{i}")
-                            df_competitor_selection = df_competitor_selection[df_competitor_selection[col_comp_material] == selected_material]
+                fig.add_shape(
+                    type="circle", 
+                    x0=0, y0=0, x1=diameter, y1=diameter, 
+                    line=dict(color=color), 
+                    name=label, 
+                    xref='x', yref='y'
+                )
+                fig.add_trace(go.Scatter(
+                    x=[x_center], y=[y_center], 
+                    mode='markers', 
+                    name=f"{label} (D={diameter:g})",
+                    marker=dict(size=10, color=color, symbol='circle')
+                ))
+
+            else: # Rectangular/Polygon
+                unit_points, count, box = duct_outlines[i]
+                if count:
+                    max_x, max_y = max(max_x, box[2]), max(max_y, box[3])
+                    x_vals, y_vals = unit_points[:count, 0].tolist(), unit_points[:count, 1].tolist()
+                    fig.add_trace(go.Scatter(x=x_vals, y=y_vals, mode='lines+markers', name=label, line=dict(color=colors[i % len(colors)]), marker=dict(size=6)))
+
+    if not (fig.data or fig.layout.shapes):
+        return None
+
+    max_x = max_x if max_x > 0 else 100
+    max_y = max_y if max_y > 0 else 100
+
+    fig.update_layout(
+        title="Supply Duct Connection (mm)", 
+        xaxis_title="Width (mm)", 
+        yaxis_title="Height (mm)",
+        xaxis=dict(range=[0, max_x * 1.15]), 
+        yaxis=dict(range=[0, max_y * 1.15])
+    )
+    fig.update_yaxes(scaleanchor="x", scaleratio=1)
+    return fig
+
+def build_electrical_heater_chart(selections, units):
+    # --- CHART 4: Electrical Heater Capacity (kW) ---
+    chart_data = []
+    for i in range(len(selections)):
+        if not units[i].empty and all(pd.notna(units[i].get(c)) for c in [capacity_range1_col, capacity_range2_col, capacity_range3_col]):
+            label = unit_label(i, selections[i])
             
-            # Storing selections
-            selections.append({
-                "country": selected_country, "brand": selected_brand,
-                "unit": selected_unit, "recovery": selected_recovery, "size": selected_size,
-                "type": selected_type, "material": selected_material,
-                # Store the global filters as well for use in the Area chart's query
-                "year": selected_year, "quarter": selected_quarter, "region": selected_region
-            })
-            # Ensure the market selection is narrowed down correctly (taking the first row if multiple match, as market data is usually high level)
-            filtered_dfs_market.append(df_market_selection.iloc[0:1])
-            filtered_dfs_competitor.append(df_competitor_selection)
+            val1 = units[i].number(capacity_range1_col)
+            val2 = units[i].number(capacity_range2_col)
+            val3 = units[i].number(capacity_range3_col)
+
+            if pd.notna(val1): chart_data.append({"Capacity Range": "Range 1", "Value (kW)": val1, "Selection": label})
+            if pd.notna(val2): chart_data.append({"Capacity Range": "Range 2", "Value (kW)": val2, "Selection": label})
+            if pd.notna(val3): chart_data.append({"Capacity Range": "Range 3", "Value (kW)": val3, "Selection": label})
+
+    if not chart_data:
+        return None
+
+    chart_df = pd.DataFrame(chart_data)
+    fig = px.bar(chart_df, x="Capacity Range", y="Value (kW)", color="Selection", barmode="group", title='Electrical Heater Capacity (kW)')
+    fig.update_yaxes(range=[0, chart_df['Value (kW)'].max() * 1.15 if not chart_df.empty else 1])
+    return fig
+
+colors = px.colors.qualitative.Plotly
+
+# Compact figures: Streamlit's frontend applies its own layout theme to every chart, so a figure only needs
+# the parts of the default "streamlit" template our traces use (the colorway placeholders it recolours and
+# the scatter marker outline) instead of carrying the full template in every message.
+COMPACT_TEMPLATE = go.layout.Template(
+    layout=go.Layout(colorway=pio.templates["streamlit"].layout.colorway),
+    data={"scatter": [go.Scatter(marker=dict(line=dict(width=0)))]},
+)
+
+def compact_figure(fig):
+    if fig is not None:
+        fig.update_layout(template=COMPACT_TEMPLATE)
+    return fig
+
+CHART_BUILDERS = {
+    "chart_area_vs_size": build_chart_area_vs_size,
+    "chart1": lambda sel, dfs: build_outline_chart(sel, dfs, 0, 'Internal Cross Section Area (Supply Filter) [mm]'),
+    "chart2": lambda sel, dfs: build_outline_chart(sel, dfs, 1, 'Internal Cross Section Area (Supply Fan) [mm]'),
+    "chart3": build_chart_duct_connection,
+    "electrical_heater_chart": build_electrical_heater_chart,
+}
+
+CHART_EMPTY_MESSAGES = {
+    "chart_area_vs_size": "No Unit Cross Section Area (Supply Filter) data available for plotting under the current brand/unit selections.",
+    "chart1": "No coordinate data available for Internal Cross Section Area (Supply Filter).",
+    "chart2": "No coordinate data available for Internal Cross Section Area (Supply Fan).",
+    "chart3": "No coordinate data available for Supply Duct Connection.",
+    "electrical_heater_chart": "No Electrical Heater Capacity data available for plotting.",
+}
+
+# Fields of a selection that any chart reads; with the dataset version and chart id they fingerprint a figure.
+# The competitor rows follow from these fields, so they are not part of the key.
+CHART_SELECTION_FIELDS = ("brand", "unit", "recovery", "size", "type", "material", "year", "quarter", "region")
+# Charts that depend on fewer fields; the area-vs-size chart only on the unit families
+CHART_FINGERPRINTS = {"chart_area_vs_size": area_cohort_key}
+
+def selection_fingerprint(s):
+    return tuple(s[f] for f in CHART_SELECTION_FIELDS)
+
+def cached_chart(chart_name, selections, units):
+    """Figure for a chart from the shared figure cache, built only when its fingerprint is new."""
+    fingerprint = CHART_FINGERPRINTS.get(chart_name, selection_fingerprint)
+    key = (dataset.version, chart_name, tuple(fingerprint(s) for s in selections))
+    return figure_cache.get_or_build(key, lambda: compact_figure(CHART_BUILDERS[chart_name](selections, units)))
 
 
-# --- Main Window ---
-
 # --- Market Overview Section ---
-st.markdown("---")
-show_market_overview = st.toggle("Show Market Overview", True)
-if show_market_overview:
+# Rows of the overview grid: (header, column position, label), resolved by the compiled schema
+market_cols_to_show = schema.market_overview
+
+# --- HTML Rendering Helpers ---
+def format_cell(val):
+    """Cell text for the HTML tables: missing values as '-', everything else escaped."""
+    if val is None or (np.ndim(val) == 0 and pd.isna(val)):
+        return "-"
+    return html.escape(str(val))
+
+def image_html(name, width, style=""):
+    """<img>/<picture> markup for images/<name> displayed at width px, or None if the image is missing.
+
+    Static mode references WebP and PNG thumbnails at 1x and 2x by URL; otherwise the 2x WebP is inlined.
+    """
+    if name not in image_manifest:
+        return None
+    alt = html.escape(str(name))
+    style_attr = f' style="{style}"' if style else ""
+    if STATIC_IMAGES:
+        webp = thumbnails.srcset(name, width, "webp", IMAGE_BASE_URL)
+        png = thumbnails.srcset(name, width, "png", IMAGE_BASE_URL)
+        if webp and png:
+            return (
+                f'<picture><source type="image/webp" srcset="{webp}">'
+                f'<img src="{png.split(" ")[0]}" srcset="{png}" width="{width}" alt="{alt}"{style_attr}></picture>'
+            )
+    data = thumbnails.get(name, width * 2, "webp")
+    if data is None:
+        return None
+    src = "data:image/webp;base64," + base64.b64encode(data).decode("ascii")
+    return f'<img src="{src}" width="{width}" alt="{alt}"{style_attr}>'
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def market_overview_html(version, headers, market_rows):
+    """The whole overview grid as one HTML table, memoised per (dataset version, selection)."""
+    total = 2 + len(headers)
+    colgroup = f'<col style="width: {2 / total:.2%};">' + "".join(f'<col style="width: {1 / total:.2%};">' for _ in headers)
+    header = "<tr><th>Parameter</th>" + "".join(f"<th>{html.escape(h)}</th>" for h in headers) + "</tr>"
+
+    body = []
+    for col, position, display_name in market_cols_to_show:
+        cells = []
+        for rows in market_rows:
+            val = market_columns.column(position)[rows[0]] if rows else None
+            img = image_html(val, LOGO_OVERVIEW_WIDTH) if col in [col_country_flag, col_brand_logo_market] and format_cell(val) != "-" else None
+            if img:
+                cells.append(f"<td>{img}</td>")
+            else:
+                cells.append(f"<td>{format_cell(val).replace(chr(10), '<br>')}</td>")
+        body.append(f"<tr><td><b>{html.escape(display_name)}</b></td>{''.join(cells)}</tr>")
+
+    return (
+        f'<table style="width: 100%; table-layout: fixed; border-collapse: collapse; vertical-align: top;">'
+        f"<colgroup>{colgroup}</colgroup><thead>{header}</thead><tbody>{''.join(body)}</tbody></table>"
+    )
+
+# Fragment: toggling the overview reruns only this block
+@st.fragment
+def market_overview(selections):
+    show_market_overview = st.toggle("Show Market Overview", True)
+    if not show_market_overview:
+        return
     st.header("Market Overview")
+
+    # One element for the whole grid; logos and flags are thumbnail URLs (or data URIs) instead of per-cell st.image calls
+    headers = tuple(s['brand'] if s['brand'] != "(any)" else f"Comparison {i+1}" for i, s in enumerate(selections))
+    market_rows = tuple(s["market_rows"] for s in selections)
+    st.markdown(market_overview_html(dataset.version, headers, market_rows), unsafe_allow_html=True)
+
+
+# --- Technical Details Helpers ---
+def render_section_table(col_names, matrix, col_widths, colors):
+    """Renders a section as ONE html table (parameters x units) instead of st.columns + st.markdown per cell."""
+    rows = matrix.rows(col_names)
+    if not rows:
+        return
+    num_units = len(matrix.present)
+    present = matrix.present
+    text = matrix.text
+
+    total = sum(col_widths)
+    colgroup = "".join(f'<col style="width: {w / total:.2%};">' for w in col_widths)
+    body = []
+    for r in rows:
+        cells = "".join(
+            f'<td style="text-align: center; color: {colors[i % len(colors)]};">{text[r, i]}</td>' if present[i]
+            else '<td style="text-align: center;">-</td>'
+            for i in range(num_units)
+        )
+        body.append(f'<tr><td>{html.escape(matrix.params[r])}</td>{cells}</tr>')
+    st.markdown(
+        f'<table style="width: 100%; table-layout: fixed; border-collapse: collapse;"><colgroup>{colgroup}</colgroup>'
+        f'<tbody>{"".join(body)}</tbody></table>',
+        unsafe_allow_html=True,
+    )
+
+# Section tables come from the compiled schema: rows are resolved headers, unresolved rows are already dropped
+sections_config = schema.sections
+
+# Every parameter a section table shows, gathered into one matrix per selection
+TABLE_PARAMS = schema.table_columns
+MATRIX_PARAMS = {col: schema.competitor_positions[col] for col in TABLE_PARAMS}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def comparison_matrix(version, positions, _units):
+    """Params x units matrix (raw and formatted) read from the selected units' records, built once per selection."""
+    return ParamMatrix(_units, MATRIX_PARAMS, formatter=format_cell)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def export_bytes(version, positions, headers, fmt):
+    """The technical comparison as CSV or Excel bytes."""
+    matrix = comparison_matrix(version, positions, [dataset.unit_record(position) for position in positions])
+    frame = matrix.to_frame(list(headers))
+    if fmt == "csv":
+        return frame.to_csv().encode("utf-8")
+    out = io.BytesIO()
+    frame.to_excel(out, sheet_name="Comparison")
+    return out.getvalue()
+
+# Fragment: each section reruns on its own when a widget inside it changes; its charts come from the
+# figure cache, so after a full rerun only the charts whose selection fingerprint changed are rebuilt.
+# Sections are lazy: a closed section sends only its header and toggle, and nothing inside it is computed.
+@st.fragment
+def technical_section(section, selections, units, matrix, col_widths):
+    st.markdown(f'<h4 style="text-align: center; font-size: 1.2em; margin: 1em 0;">{section["title"]}</h4>', unsafe_allow_html=True)
     
-    market_cols_to_show = {
-        col_market_country: "Country", col_country_flag: "Flag",
-        col_market_brand: "Brand", col_brand_logo_market: "Logo",
-        "Market information": "Market Information", "Technical demand": "Technical Demand",
-        "Company profile": "Company Profile", "Factories": "Factories",
-        "Factory in domestic market": "Local Factory", "Sales structure": "Sales Structure",
-        "Own sales structure in domestic market": "Local Sales Office",
-        "Yearly sales & product value": "Yearly Sales", "Product types": "Product Types",
-        "Compact units": "Compact Units", "Compact units. Technical information": "Compact Unit Details",
-        "Compact units. Automatics / Controller": "Compact units. Automatics / Controller",
-        "Compact units. Certifications & Standards": "Compact Unit Certs.",
-        "After sales / Service": "After Sales/Service", "Own service in domestic market": "Local Service",
-        "Comments": "Comments", "Technical barriers": "Technical Barriers", "Trade fairs": "Trade Fairs"
-    }
+    # All sections are collapsed by default. The open/closed state is kept per session outside the widget,
+    # so it survives the section being hidden (e.g. Rotary wheel when only HEX units are compared).
+    open_sections = st.session_state.setdefault("open_sections", set())
+    is_open = st.toggle(f"Show {section['title']} details", value=section["title"] in open_sections, key=f"section_open_{section['title']}")
+    if not is_open:
+        open_sections.discard(section["title"])
+        return
+    open_sections.add(section["title"])
+
+    with st.container(border=True):
+        
+        # Render Rows for the Section
+        render_section_table(section["rows"], matrix, col_widths, colors)
+
+        # Render Charts for the Section
+        for chart_name in section["charts"]:
+            fig = cached_chart(chart_name, selections, units)
+            if fig is not None:
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info(CHART_EMPTY_MESSAGES[chart_name])
 
-    # Header
-    overview_cols = st.columns([2] + [1] * num_units)
-    overview_cols[0].markdown("**Parameter**")
-    for i in range(num_units):
-        with overview_cols[i+1]:
-            s = selections[i]
-            st.markdown(f"**{s['brand']}**" if s['brand'] != "(any)" else f"**Comparison {i+1}**")
-
-    # Data Rows
-    for col, display_name in market_cols_to_show.items():
-        if col in df_market.columns:
-            row_cols = st.columns([2] + [1] * num_units)
-            row_cols[0].markdown(f"**{display_name}**")
-            for i in range(num_units):
-                with row_cols[i+1]:
-                    df_sel = filtered_dfs_market[i]
-                    if not df_sel.empty and col in df_sel.columns:
-                        val = df_sel[col].iloc[0]
-                        if pd.notna(val):
-                            if col in [col_country_flag, col_brand_logo_market]:
-                                try:
-                                    # Note: Assumes images are available locally in an 'images/' folder
-                                    st.image(f"images/{val}", width=60)
-                                except Exception:
-                                    st.write(val)
-                            else:
-                                st.write(val)
-                        else:
-                            st.write("-")
-                    else:
-                        st.write("-")
-            
+
+st.markdown("---")
+market_overview(selections)
 
 
 # --- Technical Details Section ---
@@ -295,239 +861,53 @@ st.header("Technical Details")
 if any(s['brand'] == "(any)" for s in selections):
     st.info("Select a brand for each comparison to see technical details.")
 else:
+    # One record per comparison: its first matching competitor row (None when nothing matched) and the
+    # cells read from it. Logos, photos and charts read the records; section tables and the export read
+    # the params x units matrix built from them.
+    units = [dataset.unit_record(s["competitor_rows"][0] if s["competitor_rows"] else None) for s in selections]
+    positions = tuple(unit.position for unit in units)
+    matrix = comparison_matrix(dataset.version, positions, units)
+
     # Brand Logos and Unit Photos (Keep visible for context)
     st.subheader("Brand Logos")
     logo_cols = st.columns(num_units)
     for i in range(num_units):
         with logo_cols[i]:
-            df_comp = filtered_dfs_competitor[i]
-            if not df_comp.empty and pd.notna(df_comp[col_comp_logo].iloc[0]):
-                try:
-                    # Note: Assumes images are available locally in an 'images/' folder
-                    st.image(f"images/{df_comp[col_comp_logo].iloc[0]}", width=150)
-                except Exception:
+            logo_name = units[i].get(col_comp_logo)
+            if pd.notna(logo_name):
+                logo = image_html(logo_name, LOGO_WIDTH)
+                if logo is not None:
+                    st.markdown(logo, unsafe_allow_html=True)
+                else:
                     st.write("Logo not found")
     
     st.subheader("Unit Photos")
     photo_cols = st.columns(num_units)
     for i in range(num_units):
         with photo_cols[i]:
-            df_comp = filtered_dfs_competitor[i]
-            if not df_comp.empty and pd.notna(df_comp[col_comp_unit_photo].iloc[0]):
-                try:
-                    # Note: Assumes images are available locally in an 'images/' folder
-                    st.image(f"images/{df_comp[col_comp_unit_photo].iloc[0]}", use_container_width=True)
-                except Exception:
+            photo_name = units[i].get(col_comp_unit_photo)
+            if pd.notna(photo_name):
+                photo = image_html(photo_name, PHOTO_WIDTH, style="width: 100%; height: auto;")
+                if photo is not None:
+                    st.markdown(photo, unsafe_allow_html=True)
+                else:
                     st.write("Photo not found")
 
     # Detailed Comparison Table
     st.subheader("Technical Comparison")
-    
-    # Helper for rendering data rows inside expanders (SIMPLIFIED for clarity)
-    def render_data_row(cols, col_name, df_list, num_units, colors):
-        row_cols = st.columns(cols)
-        row_cols[0].write(col_name) # col_name is the actual DF column name (e.g., 'Unit type')
-        for i in range(num_units):
-            with row_cols[i+1]:
-                df_comp = df_list[i]
-                
-                if not df_comp.empty and col_name in df_comp.columns:
-                    val = df_comp[col_name].iloc[0] 
-                    color = colors[i % len(colors)]
-                    st.markdown(f'<div style="text-align: center; color: {color};">{val}</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div style="text-align: center;">-</div>', unsafe_allow_html=True)
-
-
-    # Configuration for sections, incorporating the requested restructuring
-    sections_config = [
-        {
-            "title": "General information",
-            "rows": [col_comp_unit_type, col_comp_execution, col_comp_unit_size_quantity],
-            "charts": ["chart_area_vs_size"] # Chart now nested here
-        },
-        # --- RESTRUCTURED SECTION: INTERNAL DIMENSIONS & DUCT CONNECTIONS (RENAMED) ---
-        {
-            "title": "Internal dimensions & Duct connections", # <--- RENAMED
-            "rows": [
-                # Supply Filter Dimensions
-                internal_width_supply_filter_col,
-                internal_height_supply_filter_col,
-                unit_cross_section_area_supply_filter_area_col,
-                # Supply Fan Dimensions
-                internal_width_supply_fan_col,
-                internal_height_supply_fan_col,
-                unit_cross_section_area_supply_fan_col,
-                # Duct Connection Dimensions
-                col_comp_duct_connection_width,
-                duct_connection_height_col,
-                duct_connection_diameter_col
-            ],
-            "charts": [
-                "chart1", # Internal Cross Section Area (Supply Filter) Shape
-                "chart2", # Internal Cross Section Area (Supply Fan) Shape
-                "chart3"  # Supply Duct Connection Shape
-            ]
-        },
-        # --- END RESTRUCTURED SECTION: INTERNAL DIMENSIONS & DUCT CONNECTIONS ---
-        {
-            "title": "Certification data",
-            "rows": [
-                get_column_safe(df_competitor, ["Eurovent Certificate"]),
-                get_column_safe(df_competitor, ["Eurovent Model Box"]),
-                get_column_safe(df_competitor, ["Casing Strength (Eurovent)"]),
-                get_column_safe(df_competitor, ["Casing leakage, negative pressure (Eurovent)"]),
-                get_column_safe(df_competitor, ["Casing leakage, positive pressure (Eurovent)"]),
-                get_column_safe(df_competitor, ["Filter mounting leakage (Eurovent)"]),
-                get_column_safe(df_competitor, ["Thermal isolation (Eurovent)"]),
-                get_column_safe(df_competitor, ["Thermal bridges (Eurovent)"]),
-                get_column_safe(df_competitor, ["VDI 6022-1 certification"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Available configurations",
-            "rows": [
-                get_column_safe(df_competitor, ["Supply"]),
-                get_column_safe(df_competitor, ["Exhaust"]),
-                get_column_safe(df_competitor, ["Supply/Exhaust without recovery"]),
-                get_column_safe(df_competitor, ["Supply/Exhaust with RRG"]),
-                get_column_safe(df_competitor, ["Supply/Exhaust with PCR (HEX)"]),
-                get_column_safe(df_competitor, ["Supply/Exhaust with glycol"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Casing",
-            "rows": [
-                get_column_safe(df_competitor, ["Insulation material"]),
-                get_column_safe(df_competitor, ["Insulation thickness [mm]"]),
-                get_column_safe(df_competitor, ["Metal sheet (Internal)"]),
-                get_column_safe(df_competitor, ["Metal sheet thickness (Internal) [mm]"]),
-                get_column_safe(df_competitor, ["Metal sheet (External)"]),
-                get_column_safe(df_competitor, ["Metal sheet thickness (External) [mm]"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Airflows",
-            "rows": [
-                get_column_safe(df_competitor, ["Minimum airflow [CMH]"]),
-                get_column_safe(df_competitor, ["Maximum airflow (CCOL) [CMH]"]),
-                get_column_safe(df_competitor, ["Optimal airflow (ErP2018) [CMH]"]),
-                get_column_safe(df_competitor, ["Air speed on Filter at opt airflow (ErP) [m/s]"])
-            ],
-            "charts": []
-        },
-        # --- UPDATED SECTION: ROTARY WHEEL (Conditional hide) ---
-        {
-            "title": "Rotary wheel",
-            "rows": [
-                col_comp_type,
-                col_comp_rotor_diameter,
-                col_comp_rotor_distance,
-                col_comp_efficiency_rrg_erp,
-            ],
-            "charts": []
-        },
-        # --- END UPDATED SECTION: ROTARY WHEEL ---
-        {
-            "title": "PCR/HEX recovery exchanger",
-            "rows": [
-                col_comp_material,
-                get_column_safe(df_competitor, ["Sens. efficiency at nominal balanced airflows_PCR/HEX [%]"]),
-                get_column_safe(df_competitor, ["Efficiency-HEX/PCR"]),
-                get_column_safe(df_competitor, ["Fan power-HEX/PCR"])
-            ],
-            "charts": []
-        },
-        # --- UPDATED SECTION: FAN SECTION DATA ---
-        {
-            "title": "Fan section data",
-            "rows": [
-                col_comp_motor_type,
-                col_comp_motor_quantity,
-                col_comp_motor_power,
-                col_comp_impeller_size,
-                col_comp_impeller_efficiency
-            ],
-            "charts": []
-        },
-        # --- END UPDATED SECTION: FAN SECTION DATA ---
-        {
-            "title": "Electrical heater",
-            "rows": [
-                heating_elements_type_col
-            ],
-            "charts": ["electrical_heater_chart"] # Electrical Heater Capacity (kW)
-        },
-        {
-            "title": "Water heater",
-            "rows": [
-                get_column_safe(df_competitor, ["Water heater_min rows"]),
-                get_column_safe(df_competitor, ["Water heater_max rows"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Water cooler",
-            "rows": [
-                get_column_safe(df_competitor, ["Water cooler_min rows"]),
-                get_column_safe(df_competitor, ["Water cooler_max rows"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "DX/DXH cooler",
-            "rows": [
-                get_column_safe(df_competitor, ["DXH_min rows"]),
-                get_column_safe(df_competitor, ["DXH_max rows"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Supply Filter",
-            "rows": [
-                get_column_safe(df_competitor, ["Filter type_Supply"]),
-                get_column_safe(df_competitor, ["Filter size_Supply [mm]"]),
-                get_column_safe(df_competitor, ["Media area_Supply [m2]"]),
-                get_column_safe(df_competitor, ["Weight_Supply [kg]"])
-            ],
-            "charts": []
-        },
-        {
-            "title": "Exhaust Filter",
-            "rows": [
-                get_column_safe(df_competitor, ["Filter type_Exhaust"]),
-                get_column_safe(df_competitor, ["Filter size_Exhaust [mm]"]),
-                get_column_safe(df_competitor, ["Media area_Exhaust [m2]"]),
-                get_column_safe(df_competitor, ["Weight_Exhaust [kg]"])
-            ],
-            "charts": []
-        },
-        # --- UPDATED SECTION: SILENCER DATA (Removed duplicated duct connection columns) ---
-        {
-            "title": "Silencer data",
-            "rows": [
-                silencer_casing_col,
-                get_column_safe(df_competitor, ["Silencer length [mm]"]),
-                # Removed: col_comp_duct_connection_width, duct_connection_height_col, duct_connection_diameter_col
-            ],
-            "charts": [] 
-        },
-        # --- END UPDATED SECTION: SILENCER DATA ---
-        {
-            "title": "Construction details",
-            "rows": [
-                base_frame_height_col,
-                cabling_col
-            ],
-            "charts": []
-        }
-    ]
+    export_headers = tuple(f"{s['brand']} - {s['unit']} - {s['size']}" for s in selections)
+    export_cols = st.columns(2)
+    # Deferred: the file is only generated when a download button is clicked
+    export_cols[0].download_button(
+        "Download CSV", data=lambda: export_bytes(dataset.version, positions, export_headers, "csv"),
+        file_name="technical_comparison.csv", mime="text/csv",
+    )
+    export_cols[1].download_button(
+        "Download Excel", data=lambda: export_bytes(dataset.version, positions, export_headers, "xlsx"),
+        file_name="technical_comparison.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
     
     col_widths = [3] + [2] * num_units
-    colors = px.colors.qualitative.Plotly
 
     # --- CONDITIONAL HIDING LOGIC IMPLEMENTATION ---
     # Determine the unique recovery types selected across all comparison units
@@ -558,7 +938,7 @@ else:
             st.markdown(f"**{s['brand']} - {s['unit']} - {s['size']}**") 
     table_header_cols[0].markdown("---")
 
-    # Loop through sections and create expanders
+    # Loop through sections and render each one as a lazy, independently rerunning fragment
     for section in sections_config:
         
         # Apply Conditional Hiding
@@ -568,268 +948,4 @@ else:
         if section["title"] == "PCR/HEX recovery exchanger" and not show_hex_pcr_details:
             continue
         
-        st.markdown(f'<h4 style="text-align: center; font-size: 1.2em; margin: 1em 0;">{section["title"]}</h4>', unsafe_allow_html=True)
-        
-        # All sections are collapsed by default
-        with st.expander(f"Show {section['title']} details", expanded=False): 
-            
-            # Render Rows for the Section
-            for col_name in section["rows"]:
-                if col_name in df_competitor.columns and col_name not in coord_cols:
-                    render_data_row(col_widths, col_name, filtered_dfs_competitor, num_units, colors)
-
-            # Render Charts for the Section
-            for chart_name in section["charts"]:
-                
-                # --- CHART: Unit Cross Section Area (Supply Filter) vs Unit Size (Scatter) ---
-                if chart_name == "chart_area_vs_size":
-                    full_chart_data = []
-                    unique_y_labels = []
-
-                    for i, s in enumerate(selections):
-                        brand = s.get('brand')
-                        unit = s.get('unit')
-                        recovery = s.get('recovery')
-                        
-                        if brand and brand != "(any)" and unit and recovery:
-                            temp_df = df_competitor[
-                                (df_competitor[col_comp_brand] == brand) &
-                                (df_competitor[col_comp_unit_name] == unit) &
-                                (df_competitor[col_comp_recovery] == recovery) &
-                                (df_competitor[col_comp_year] == s.get('year')) &
-                                (df_competitor[col_comp_quarter] == s.get('quarter')) &
-                                (df_competitor[col_comp_region] == s.get('region'))
-                            ].copy()
-                            
-                            if recovery == "RRG" and s.get('type'):
-                                temp_df = temp_df[temp_df[col_comp_type] == s.get('type')]
-                            elif recovery in ["HEX", "PCR"] and s.get('material'):
-                                temp_df = temp_df[temp_df[col_comp_material] == s.get('material')]
-                            
-                            
-                            if not temp_df.empty and unit_cross_section_area_supply_filter_area_col in temp_df.columns and col_comp_size in temp_df.columns:
-                                unique_sizes_df = temp_df.drop_duplicates(subset=[col_comp_size, unit_cross_section_area_supply_filter_area_col])
-
-                                for _, row in unique_sizes_df.iterrows():
-                                    area_val_raw = row[unit_cross_section_area_supply_filter_area_col]
-                                    area_val = pd.to_numeric(area_val_raw, errors='coerce')
-                                    
-                                    unit_size = row[col_comp_size]
-                                    y_label = f"{brand} - {unit_size}"
-                                    
-                                    if pd.notna(area_val) and area_val > 0:
-                                        full_chart_data.append({
-                                            "Y-Label": y_label, 
-                                            "Area (m²)": area_val, 
-                                            "Brand": brand,
-                                            "Unit Size": unit_size
-                                        })
-                                        
-                                        if y_label not in unique_y_labels:
-                                            unique_y_labels.append(y_label)
-
-                    
-                    if full_chart_data:
-                        chart_df = pd.DataFrame(full_chart_data)
-                        unique_y_labels.reverse() 
-                        
-                        fig = px.scatter(
-                            chart_df, 
-                            x="Area (m²)", 
-                            y="Y-Label", 
-                            color="Brand", 
-                            hover_data={"Unit Size": True, "Area (m²)": ":.3f"},
-                            title='Unit Cross Section Area (Supply Filter) vs Unit Size',
-                            color_discrete_sequence=colors
-                        )
-
-                        fig.update_traces(marker=dict(size=10, opacity=0.8), mode='markers')
-                        
-                        fig.update_layout(
-                            yaxis={
-                                'categoryorder': 'array', 
-                                'categoryarray': unique_y_labels,
-                                'title': 'Brand and Unit Size' # UPDATED Y-AXIS TITLE
-                            },
-                            xaxis=dict(range=[0, chart_df['Area (m²)'].max() * 1.15], title='Area (m²)'),
-                            height=200 + 30 * len(unique_y_labels)
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No Unit Cross Section Area (Supply Filter) data available for plotting under the current brand/unit selections.")
-
-
-                # --- CHART 1: Internal Cross Section Area (Supply Filter) Shape ---
-                elif chart_name == "chart1":
-                    # This chart is nested under Internal dimensions & Duct connections
-                    fig = go.Figure()
-                    all_x, all_y = [], []
-                    
-                    for i, df_unit in enumerate(filtered_dfs_competitor):
-                        if not df_unit.empty:
-                            x_vals, y_vals = [], []
-                            label = f"Unit {i+1}: {selections[i]['brand']} - {selections[i]['size']}"
-                            for x_name, y_name in coord_col_pairs_1_5:
-                                if x_name in df_unit and y_name in df_unit and pd.notna(df_unit[x_name].iloc[0]) and pd.notna(df_unit[y_name].iloc[0]):
-                                    x_vals.append(df_unit[x_name].iloc[0])
-                                    y_vals.append(df_unit[y_name].iloc[0])
-                            
-                            if x_vals and y_vals:
-                                all_x.extend(x_vals)
-                                all_y.extend(y_vals)
-                                fig.add_trace(go.Scatter(
-                                    x=x_vals, y=y_vals, mode='lines+markers', 
-                                    name=label, 
-                                    line=dict(color=colors[i % len(colors)]),
-                                    marker=dict(size=6)
-                                ))
-                        
-                    if fig.data:
-                        max_x = max(all_x) if all_x else 1
-                        max_y = max(all_y) if all_y else 1
-
-                        fig.update_yaxes(scaleanchor="x", scaleratio=1)
-                        fig.update_layout(
-                            title='Internal Cross Section Area (Supply Filter) [mm]', 
-                            xaxis_title='Width (mm)', 
-                            yaxis_title='Height (mm)',
-                            xaxis=dict(range=[0, max_x * 1.15]), 
-                            yaxis=dict(range=[0, max_y * 1.15]), 
-                            hovermode="closest"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No coordinate data available for Internal Cross Section Area (Supply Filter).")
-
-
-                # --- CHART 2: Internal Cross Section Area (Supply Fan) Shape ---
-                elif chart_name == "chart2":
-                    # This chart is nested under Internal dimensions & Duct connections
-                    fig = go.Figure()
-                    all_x, all_y = [], []
-                    
-                    for i, df_unit in enumerate(filtered_dfs_competitor):
-                        if not df_unit.empty:
-                            x_vals, y_vals = [], []
-                            label = f"Unit {i+1}: {selections[i]['brand']} - {selections[i]['size']}"
-                            for x_name, y_name in coord_col_pairs_6_10:
-                                if x_name in df_unit and y_name in df_unit and pd.notna(df_unit[x_name].iloc[0]) and pd.notna(df_unit[y_name].iloc[0]):
-                                    x_vals.append(df_unit[x_name].iloc[0])
-                                    y_vals.append(df_unit[y_name].iloc[0])
-
-                            if x_vals and y_vals:
-                                all_x.extend(x_vals)
-                                all_y.extend(y_vals)
-                                fig.add_trace(go.Scatter(
-                                    x=x_vals, y=y_vals, mode='lines+markers', 
-                                    name=label, 
-                                    line=dict(color=colors[i % len(colors)]),
-                                    marker=dict(size=6)
-                                ))
-
-                    if fig.data:
-                        max_x = max(all_x) if all_x else 1
-                        max_y = max(all_y) if all_y else 1
-                        
-                        fig.update_yaxes(scaleanchor="x", scaleratio=1)
-                        fig.update_layout(
-                            title='Internal Cross Section Area (Supply Fan) [mm]', 
-                            xaxis_title='Width (mm)', 
-                            yaxis_title='Height (mm)',
-                            xaxis=dict(range=[0, max_x * 1.15]), 
-                            yaxis=dict(range=[0, max_y * 1.15]), 
-                            hovermode="closest"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No coordinate data available for Internal Cross Section Area (Supply Fan).")
-
-                # --- CHART 3: Supply Duct Connection Shape ---
-                elif chart_name == "chart3":
-                    # This chart is nested under Internal dimensions & Duct connections
-                    fig = go.Figure()
-                    max_x = 0
-                    max_y = 0
-
-                    for i, df_unit in enumerate(filtered_dfs_competitor):
-                        if not df_unit.empty:
-                            is_circ = pd.notna(df_unit[duct_connection_diameter_col].iloc[0]) and df_unit[duct_connection_diameter_col].iloc[0] > 0
-                            
-                            label = f"Unit {i+1}: {selections[i]['brand']} - {selections[i]['size']}"
-
-                            if is_circ:
-                                diameter = df_unit[duct_connection_diameter_col].iloc[0]
-                                radius = diameter / 2.0
-                                color = colors[i % len(colors)]
-                                
-                                x_center = radius
-                                y_center = radius
-                                
-                                max_x = max(max_x, x_center + radius)
-                                max_y = max(max_y, y_center + radius)
-                                
-                                fig.add_shape(
-                                    type="circle", 
-                                    x0=0, y0=0, x1=diameter, y1=diameter, 
-                                    line=dict(color=color), 
-                                    name=label, 
-                                    xref='x', yref='y'
-                                )
-                                fig.add_trace(go.Scatter(
-                                    x=[x_center], y=[y_center], 
-                                    mode='markers', 
-                                    name=f"{label} (D={diameter})",
-                                    marker=dict(size=10, color=color, symbol='circle')
-                                ))
-
-                            else: # Rectangular/Polygon
-                                x_vals, y_vals = [], []
-                                for j, (x_name, y_name) in enumerate(coord_col_pairs_11_15):
-                                    if x_name in df_unit and y_name in df_unit and pd.notna(df_unit[x_name].iloc[0]) and pd.notna(df_unit[y_name].iloc[0]):
-                                        x_vals.append(df_unit[x_name].iloc[0])
-                                        y_vals.append(df_unit[y_name].iloc[0])
-                                if x_vals and y_vals:
-                                    max_x = max(max_x, max(x_vals))
-                                    max_y = max(max_y, max(y_vals))
-                                    fig.add_trace(go.Scatter(x=x_vals, y=y_vals, mode='lines+markers', name=label, line=dict(color=colors[i % len(colors)]), marker=dict(size=6)))
-            
-                    if fig.data or fig.layout.shapes:
-                        max_x = max_x if max_x > 0 else 100
-                        max_y = max_y if max_y > 0 else 100
-                    
-                        fig.update_layout(
-                            title="Supply Duct Connection (mm)", 
-                            xaxis_title="Width (mm)", 
-                            yaxis_title="Height (mm)",
-                            xaxis=dict(range=[0, max_x * 1.15]), 
-                            yaxis=dict(range=[0, max_y * 1.15])
-                        )
-                        fig.update_yaxes(scaleanchor="x", scaleratio=1)
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No coordinate data available for Supply Duct Connection.")
-
-
-                # --- CHART 4: Electrical Heater Capacity (kW) ---
-                elif chart_name == "electrical_heater_chart":
-                    # This chart is nested under Electrical heater
-                    chart_data = []
-                    for i, df_unit in enumerate(filtered_dfs_competitor):
-                        if not df_unit.empty and all(c in df_unit and pd.notna(df_unit[c].iloc[0]) for c in [capacity_range1_col, capacity_range2_col, capacity_range3_col]):
-                            label = f"Unit {i+1}: {selections[i]['brand']} - {selections[i]['size']}"
-                            
-                            val1 = pd.to_numeric(df_unit[capacity_range1_col].iloc[0], errors='coerce')
-                            val2 = pd.to_numeric(df_unit[capacity_range2_col].iloc[0], errors='coerce')
-                            val3 = pd.to_numeric(df_unit[capacity_range3_col].iloc[0], errors='coerce')
-
-                            if pd.notna(val1): chart_data.append({"Capacity Range": "Range 1", "Value (kW)": val1, "Selection": label})
-                            if pd.notna(val2): chart_data.append({"Capacity Range": "Range 2", "Value (kW)": val2, "Selection": label})
-                            if pd.notna(val3): chart_data.append({"Capacity Range": "Range 3", "Value (kW)": val3, "Selection": label})
-
-                    if chart_data:
-                        chart_df = pd.DataFrame(chart_data)
-                        fig = px.bar(chart_df, x="Capacity Range", y="Value (kW)", color="Selection", barmode="group", title='Electrical Heater Capacity (kW)')
-                        fig.update_yaxes(range=[0, chart_df['Value (kW)'].max() * 1.15 if not chart_df.empty else 1])
-                        st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("No Electrical Heater Capacity data available for plotting.")
\ No newline at end of file
+        technical_section(section, selections, units, matrix, col_widths)